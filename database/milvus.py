@@ -0,0 +1,42 @@
+# database/milvus.py
+from pymilvus import connections, Collection
+from dotenv import load_dotenv
+import threading
+import os
+
+load_dotenv()
+
+MILVUS_URI = os.getenv("MILVUS_URI") or "http://localhost:19530"
+MILVUS_ALIAS = "default"
+
+# Loaded collections shared by the retriever, citations and the semantic cache
+_collections = {}
+_lock = threading.Lock()
+
+def connect_milvus(uri: str = MILVUS_URI):
+    """Open the shared "default" connection if it isn't open yet"""
+    if not connections.has_connection(MILVUS_ALIAS):
+        connections.connect(alias=MILVUS_ALIAS, uri=uri)
+
+def get_collection(name: str, uri: str = MILVUS_URI) -> Collection:
+    """Collection handle, loaded once per process (load() is an RPC even when already loaded)"""
+    col = _collections.get(name)
+    if col is not None:
+        return col
+    with _lock:
+        if name not in _collections:
+            connect_milvus(uri)
+            col = Collection(name)
+            col.load()
+            _collections[name] = col
+        return _collections[name]
+
+def close_milvus():
+    """Forget cached handles and disconnect (app shutdown).
+
+    Collections are not released: other processes may still be searching them.
+    """
+    with _lock:
+        _collections.clear()
+        if connections.has_connection(MILVUS_ALIAS):
+            connections.disconnect(MILVUS_ALIAS)
@@ -0,0 +1,93 @@
+# helper/batched_embedder.py
+import asyncio
+import logging
+import os
+from typing import Callable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "16"))
+EMBED_MAX_WAIT_MS = float(os.getenv("EMBED_MAX_WAIT_MS", "5"))
+
+
+class BatchedEmbedder:
+    """
+    Coalesces concurrent embed calls into one encode call.
+
+    Requests arriving within max_wait_ms of the first one (up to max_batch)
+    are encoded together in a worker thread; each caller awaits its own future.
+    """
+
+    def __init__(
+        self,
+        encode_fn: Callable[[List[str]], List[List[float]]],
+        max_batch: int = EMBED_MAX_BATCH,
+        max_wait_ms: float = EMBED_MAX_WAIT_MS,
+    ):
+        self.encode_fn = encode_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    # ---- public API ----
+    async def embed(self, text: str) -> List[float]:
+        """Embed a single text as part of the next batch"""
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    async def close(self):
+        """Stop the background worker"""
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+            self._queue = None
+
+    # ---- internal ----
+    def _ensure_worker(self):
+        # Queue and task are bound to the running loop, so create them lazily
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+    async def _collect(self) -> List[Tuple[str, asyncio.Future]]:
+        """Wait for one item, then take whatever else arrives within the window"""
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            texts = [text for text, _ in batch]
+            try:
+                vectors = await asyncio.to_thread(self.encode_fn, texts)
+            except Exception as e:
+                logger.warning("Batched embedding failed (%d texts): %s", len(texts), e)
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
@@ -1,16 +1,63 @@
 # helper/core.py
-from typing import Dict, Any, Optional, List
+from dataclasses import dataclass
+from typing import Dict, Any, AsyncIterator, Optional, List, Tuple
+import asyncio
+import logging
 import os
 from dotenv import load_dotenv
 
 from helper.llm import LLMClient
-from helper.retriver_engine import RetrieverEngine
+from helper.retriver_engine import Chunks, RetrieverEngine
 from helper.tools import build_context, chunks_to_sources
-from helper.prep_citation import create_section_html_from_chunk
+from helper.prep_citation import create_section_html_from_chunk, create_section_html_from_listchunks
 from helper.memory import SimpleMemoryManager  # Updated import
+from helper.semantic_cache import SemanticCache
+from schemas.chat_models import LLMResponse
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "1") == "1"
+# Similarity floor for the best chunk; below it the LLM is skipped (IP/COSINE metrics only)
+MIN_RELEVANCE = float(os.getenv("MIN_RELEVANCE", "0.3"))
+NOT_FOUND_ANSWER = "Not found in knowledge base."
+
+# Prompt template is built once; process_query only fills the placeholders.
+# Only the memory block and the instruction line differ between the two cases.
+_PROMPT_TEMPLATE = """{memory_context}# DOCUMENT KNOWLEDGE
+{context_text}
+
+# QUESTION
+{query}
+
+{instruction}
+
+CITATION RULES:
+1. Answer ONLY if the query is directly covered by the context
+2. files_used = number of UNIQUE file_ids used (max 3); citation_limit = files_used
+3. citation_required: "yes" ONLY if the answer uses the context
+
+Respond with JSON only, in this exact format:
+{{"answer": "...", "citation_required": "yes" or "no", "citation_limit": 0, "files_used": 0}}"""
+
+_INSTRUCTION_WITH_MEMORY = (
+    "Answer based on both conversation history and document knowledge above. "
+    "Be consistent with previous discussions."
+)
+_INSTRUCTION_NO_MEMORY = "Answer based on the document knowledge above."
+
+
+@dataclass(slots=True)
+class _PreparedQuery:
+    """State carried from retrieval/prompt building to the post-LLM steps"""
+    prompt: str
+    chunks: Chunks
+    query_vector: List[float]
+    memory_used: bool
+    use_cache: bool
+
+
 class RagOrchestrator:
     def __init__(
         self,
@@ -19,6 +66,7 @@ class RagOrchestrator:
         embedding_model: str = "all-MiniLM-L12-v2",
         groq_model: str = "llama-3.3-70b-versatile",
         prep_citations_func=create_section_html_from_chunk,
+        prep_citations_batch_func=create_section_html_from_listchunks,
     ):
         self.llm_client = LLMClient(groq_model)
         self.retriever = RetrieverEngine(
@@ -26,8 +74,14 @@ class RagOrchestrator:
             collection_name=collection_name,
             embedding_model=embedding_model,
         )
-        self.memory_manager = SimpleMemoryManager()  # Simple memory manager
+        # Memory relevance reuses the (cached, micro-batched) query embedder
+        self.memory_manager = SimpleMemoryManager(embed_fn=self.retriever.aembed_query)
         self.prep_citations_func = prep_citations_func
+        self.prep_citations_batch_func = prep_citations_batch_func
+        self.semantic_cache = None
+        if SEMANTIC_CACHE_ENABLED:
+            dim = len(self.retriever.embed_query("dimension probe"))
+            self.semantic_cache = SemanticCache(dim=dim)
     
     async def process_query(
         self, 
@@ -36,111 +90,136 @@ class RagOrchestrator:
         user_id: Optional[str] = None
     ) -> Dict[str, Any]:
         
-        # STEP 1: Get memory context if session exists
-        memory_context = ""
-        if session_id:
-            memory_context = await self.memory_manager.get_memory_context(session_id, query)
+        result, prepared = await self._prepare(query, session_id)
+        if result is not None:
+            return result
         
-        # STEP 2: Retrieve relevant documents
-        retrieval = self.retriever.get_retrieval_context(query)
-        chunks = retrieval["chunks"]
-        context_text = build_context(chunks)
+        # STEP 4: Generate response
+        llm_response = await self.llm_client.agenerate_json_response(prepared.prompt)
+        logger.debug("raw LLM response: %s", llm_response)
         
-        # STEP 3: Create enhanced prompt
-        if memory_context:
-            prompt = f"""{memory_context}# DOCUMENT KNOWLEDGE
-{context_text}
-
-# CURRENT QUESTION
-{query}
-
-Answer based on both conversation history and document knowledge above.
-Be consistent with previous discussions.
-
-SMART CITATION RULES:
-# 1. Answer ONLY if query is DIRECTLY in context
-# 2. Count UNIQUE file_id's in context:
-#    - 1 file → "files_used": 1, "citation_limit": 1
-#    - 2 files → "files_used": 2, "citation_limit": 2  
-#    - 3+ files → "files_used": 3, "citation_limit": 3
-# 3. Same file multiple chunks → count as 1 file
-# 4. citation_required: "yes" ONLY if answer uses context
-
-# JSON ONLY - NO OTHER TEXT!
-
-Respond in this exact JSON format:
-{{
-  "answer": "Your detailed answer here...",
-  "citation_required": "yes" or "no",
-  "citation_limit": 0,
-  "files_used": 0
-}}"""
+        return await self._finish(query, session_id, prepared, llm_response)
+    
+    async def process_query_stream(
+        self,
+        query: str,
+        session_id: Optional[str] = None,
+        user_id: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streaming variant of process_query.
+        
+        Yields {"type": "token", "text": ...} as answer text arrives, then
+        {"type": "result", "result": ...} with the same dict process_query returns.
+        """
+        result, prepared = await self._prepare(query, session_id)
+        if result is None:
+            async for kind, payload in self.llm_client.astream_json_response(prepared.prompt):
+                if kind == "token":
+                    yield {"type": "token", "text": payload}
+                else:
+                    logger.debug("raw LLM response: %s", payload)
+                    result = await self._finish(query, session_id, prepared, payload)
         else:
-            prompt = f"""# DOCUMENT KNOWLEDGE
-{context_text}
-
-# QUESTION
-{query}
-
-Answer based on the document knowledge above.
-
-SMART CITATION RULES:
-# 1. Answer ONLY if query is DIRECTLY in context
-# 2. Count UNIQUE file_id's in context:
-#    - 1 file → "files_used": 1, "citation_limit": 1
-#    - 2 files → "files_used": 2, "citation_limit": 2  
-#    - 3+ files → "files_used": 3, "citation_limit": 3
-# 3. Same file multiple chunks → count as 1 file
-# 4. citation_required: "yes" ONLY if answer uses context
-
-# JSON ONLY - NO OTHER TEXT!
-
-Respond in this exact JSON format:
-{{
-  "answer": "Your detailed answer here...",
-  "citation_required": "yes" or "no",
-  "citation_limit": 0,
-  "files_used": 0
-}}"""
+            # Answered without the LLM (not found / cache hit): one token with the whole answer
+            yield {"type": "token", "text": result["answer"]}
+        yield {"type": "result", "result": result}
+    
+    async def _prepare(
+        self,
+        query: str,
+        session_id: Optional[str]
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[_PreparedQuery]]:
+        """Steps 1-3. Returns (result, None) when the query is answered without the LLM"""
+        # Embed once (micro-batched with concurrent requests); reused by the cache and retrieval
+        query_vector = await self.retriever.aembed_query(query)
         
-        # STEP 4: Generate response
-        llm_response = self.llm_client.generate_json_response(prompt)
+        # STEP 1 + 2: Memory context and document retrieval are independent, run together
+        memory_task = self._get_memory_context(session_id, query, query_vector)
+        retrieval_task = asyncio.to_thread(
+            self.retriever.get_retrieval_context,
+            query,
+            query_vector=query_vector
+        )
+        memory_context, retrieval = await asyncio.gather(memory_task, retrieval_task)
+        
+        chunks = retrieval["chunks"]
+        if not memory_context and not self._is_relevant(chunks):
+            # Nothing worth sending to the LLM; answer directly and keep it out of memory
+            # (follow-ups with history still go to the LLM, which can answer from it)
+            logger.debug("no relevant chunks for query, skipping LLM")
+            return {
+                "status": "success",
+                "query": query,
+                "answer": NOT_FOUND_ANSWER,
+                "citation_required": False,
+                "citation_limit": 0,
+                "files_used": 0,
+                "citations": [],
+                "chunks_retrieved": len(chunks),
+                "session_id": session_id,
+                "memory_used": False,
+            }, None
+        
+        # Semantic cache: answers depend on history, so only memory-free prompts are cached
+        use_cache = bool(self.semantic_cache) and not memory_context
+        if use_cache:
+            try:
+                cached = await asyncio.to_thread(self.semantic_cache.lookup, query_vector)
+            except Exception as e:
+                logger.warning("Semantic cache error: %s", e)
+                cached = None
+            if cached:
+                result = {
+                    **cached,
+                    "query": query,
+                    "session_id": session_id,
+                    "memory_used": False,
+                    "cache_hit": True,
+                }
+                if session_id:
+                    await self._update_memory(session_id, query, result)
+                return result, None
+        
+        context_text = build_context(chunks)
+        logger.debug("retrieved context: %s", context_text)
         
-        answer = llm_response.get("answer", "No answer generated")
-        citation_required = llm_response.get("citation_required", "no") == "yes"
-        citation_limit = int(llm_response.get("citation_limit", 0))
-        files_used = int(llm_response.get("files_used", 0))
+        # STEP 3: Create enhanced prompt
+        prompt = _PROMPT_TEMPLATE.format_map({
+            "memory_context": memory_context,
+            "context_text": context_text,
+            "query": query,
+            "instruction": _INSTRUCTION_WITH_MEMORY if memory_context else _INSTRUCTION_NO_MEMORY,
+        })
+        return None, _PreparedQuery(prompt, chunks, query_vector, bool(memory_context), use_cache)
+    
+    async def _finish(
+        self,
+        query: str,
+        session_id: Optional[str],
+        prepared: _PreparedQuery,
+        llm_response: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Steps 5-6: citations and write-backs for a parsed LLM response"""
+        resp = LLMResponse.model_validate(llm_response)
+        answer = resp.answer
+        citation_required = resp.citation_required == "yes"
+        citation_limit = resp.citation_limit
+        files_used = resp.files_used
+        chunks = prepared.chunks
         
         # STEP 5: Citations
         citations = []
         if citation_required and citation_limit > 0:
             try:
-                citation_retrieval = self.retriever.get_retrieval_context(
-                    query,
-                    limit=citation_limit
-                )
-                citation_chunks = citation_retrieval["chunks"]
+                # Top-k of the same search, so slice instead of querying Milvus again
+                citation_chunks = chunks[:citation_limit]
                 sources = chunks_to_sources(citation_chunks)
-                citations = self._prepare_citations(sources)
+                citations = await asyncio.to_thread(self._prepare_citations, sources)
             except Exception as e:
-                print(f"⚠ Citation error: {e}")
+                logger.warning("Citation error: %s", e)
         
-        # STEP 6: Update memory
-        if session_id:
-            await self.memory_manager.add_to_memory(
-                session_id=session_id,
-                user_message=query,
-                ai_response=answer,
-                metadata={
-                    "citation_required": citation_required,
-                    "citation_limit": citation_limit,
-                    "files_used": files_used,
-                    "citations_count": len(citations),
-                    "chunks_retrieved": len(chunks)
-                }
-            )
-        
-        return {
+        result = {
             "status": "success",
             "query": query,
             "answer": answer,
@@ -150,23 +229,100 @@ Respond in this exact JSON format:
             "citations": citations,
             "chunks_retrieved": len(chunks),
             "session_id": session_id,
-            "memory_used": bool(memory_context)
+            "memory_used": prepared.memory_used
         }
+        
+        # STEP 6: Cache write and memory update are independent, run together
+        write_backs = []
+        if prepared.use_cache:
+            write_backs.append(self._store_in_cache(prepared.query_vector, result))
+        if session_id:
+            write_backs.append(self._update_memory(session_id, query, result))
+        await asyncio.gather(*write_backs)
+        
+        return result
+    
+    def _is_relevant(self, chunks: Chunks) -> bool:
+        """False when retrieval found nothing, or nothing above MIN_RELEVANCE"""
+        if not chunks:
+            return False
+        if self.retriever.metric_type in ("IP", "COSINE"):
+            return max(chunks.scores) >= MIN_RELEVANCE
+        return True  # L2 distances have no fixed similarity scale
+    
+    async def _get_memory_context(
+        self,
+        session_id: Optional[str],
+        query: str,
+        query_vector: Optional[List[float]] = None,
+    ) -> str:
+        """Memory context for the session (empty when there is no session)"""
+        if not session_id:
+            return ""
+        return await self.memory_manager.get_memory_context(
+            session_id, query, query_vector=query_vector
+        )
+    
+    async def _store_in_cache(self, query_vector: List[float], result: Dict[str, Any]):
+        """Insert the result into the semantic cache without blocking the event loop"""
+        try:
+            await asyncio.to_thread(self.semantic_cache.store, query_vector, result)
+        except Exception as e:
+            logger.warning("Semantic cache error: %s", e)
+    
+    async def _update_memory(self, session_id: str, query: str, result: Dict[str, Any]):
+        """Record the exchange in session memory"""
+        await self.memory_manager.add_to_memory(
+            session_id=session_id,
+            user_message=query,
+            ai_response=result["answer"],
+            metadata={
+                "citation_required": result["citation_required"],
+                "citation_limit": result["citation_limit"],
+                "files_used": result["files_used"],
+                "citations_count": len(result["citations"]),
+                "chunks_retrieved": result["chunks_retrieved"],
+                "cache_hit": result.get("cache_hit", False)
+            }
+        )
     
     def _prepare_citations(self, sources: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Prepare citations from sources"""
+        """Prepare citations from sources (one batched call when available)"""
+        sources = [s for s in sources if s.get("file_id") and s.get("chunk_id")]
+        if self.prep_citations_batch_func:
+            pairs = [(s["file_id"], s["chunk_id"]) for s in sources]
+            try:
+                html_paths = self.prep_citations_batch_func(pairs)
+            except Exception as e:
+                logger.warning("Citation error: %s", e)
+                html_paths = [None] * len(sources)
+            return [{**s, "citation_path": p} for s, p in zip(sources, html_paths)]
+
         out = []
         for s in sources:
-            file_id = s.get("file_id")
-            chunk_id = s.get("chunk_id")
-            if file_id and chunk_id:
-                try:
-                    html_path = self.prep_citations_func(file_id, chunk_id)
-                    out.append({**s, "citation_path": html_path})
-                except Exception:
-                    out.append({**s, "citation_path": None})
+            try:
+                html_path = self.prep_citations_func(s["file_id"], s["chunk_id"])
+                out.append({**s, "citation_path": html_path})
+            except Exception:
+                out.append({**s, "citation_path": None})
         return out
     
+    async def record_turn(self, session_id: Optional[str], query: str, result: Dict[str, Any]):
+        """Record an answer served without the pipeline (e.g. a query cache hit) in session memory"""
+        if session_id:
+            await self._update_memory(session_id, query, result)
+    
     async def get_memory_info(self, session_id: str) -> Dict[str, Any]:
         """Get memory information"""
-        return self.memory_manager.get_session_info(session_id)
\ No newline at end of file
+        return self.memory_manager.get_session_info(session_id)
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Semantic cache and query embedding cache hit/miss counters"""
+        if self.semantic_cache:
+            semantic = {"enabled": True, **self.semantic_cache.stats()}
+        else:
+            semantic = {"enabled": False}
+        return {
+            "semantic_cache": semantic,
+            "embedding_cache": self.retriever.cache_info()._asdict(),
+        }
\ No newline at end of file
@@ -1,23 +1,166 @@
 # helper/llm.py
-import json
+import asyncio
 import re
-from typing import Dict, Any
+from functools import lru_cache
+from typing import Dict, Any, AsyncIterator, Optional, Tuple
+import httpx
+import orjson
 from langchain_groq import ChatGroq
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Upper bound on in-flight Groq requests per process (rate-limit friendly)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+_llm_semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+# Keep-alive connection pool shared by every ChatGroq instance in the process
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "200"))
+LLM_HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "100"))
+LLM_HTTP_TIMEOUT = float(os.getenv("LLM_HTTP_TIMEOUT", "30"))
+_http_client: Optional[httpx.Client] = None
+_http_async_client: Optional[httpx.AsyncClient] = None
+
+# Compiled once; used by _parse_json_response fallbacks.
+# Fallbacks only look at the head of the response
+_REGEX_SCAN_LIMIT = 64 * 1024
+_ANSWER_RE = re.compile(r'"answer"[:\s]*"([^"]*)"')
+_CITATION_REQUIRED_RE = re.compile(r'"citation_required"[:\s]*"([^"]*)"')
+# Streaming: start of the answer string value, and runs of plain (unescaped) characters
+_ANSWER_START_RE = re.compile(r'"answer"\s*:\s*"')
+_PLAIN_RUN_RE = re.compile(r'[^"\\]+')
+_JSON_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+def _outer_json_span(text: str, end: Optional[int] = None) -> Optional[str]:
+    """First '{' to last '}' of text[:end], found in linear time (a regex retries every '{')"""
+    if end is None:
+        end = len(text)
+    start = text.find('{', 0, end)
+    if start == -1:
+        return None
+    stop = text.rfind('}', start, end)
+    if stop == -1:
+        return None
+    return text[start:stop + 1]
+
+def _loads_dict(text: str) -> Optional[Dict[str, Any]]:
+    """orjson.loads that only accepts a JSON object"""
+    try:
+        parsed = orjson.loads(text)
+    except orjson.JSONDecodeError:
+        return None
+    return parsed if isinstance(parsed, dict) else None
+
+def _shared_http_clients() -> Tuple[httpx.Client, httpx.AsyncClient]:
+    """Process-wide sync/async HTTP/2 clients, created on first use"""
+    global _http_client, _http_async_client
+    if _http_client is None or _http_async_client is None:
+        limits = httpx.Limits(
+            max_connections=LLM_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_HTTP_MAX_KEEPALIVE,
+        )
+        _http_client = httpx.Client(http2=True, limits=limits, timeout=LLM_HTTP_TIMEOUT)
+        _http_async_client = httpx.AsyncClient(http2=True, limits=limits, timeout=LLM_HTTP_TIMEOUT)
+    return _http_client, _http_async_client
+
+async def close_http_clients():
+    """Close the shared LLM HTTP clients (app shutdown)"""
+    global _http_client, _http_async_client
+    if _http_async_client is not None:
+        await _http_async_client.aclose()
+    if _http_client is not None:
+        _http_client.close()
+    _http_client = _http_async_client = None
+
+@lru_cache(maxsize=None)
+def get_llm_client(model: str = "llama-3.3-70b-versatile") -> "LLMClient":
+    """One LLMClient per model, for callers that don't keep their own"""
+    return LLMClient(model)
+
+class AnswerStreamDecoder:
+    """
+    Pulls the "answer" string value out of a JSON response while it is streamed.
+
+    feed() takes raw model deltas and returns the newly decoded answer text;
+    escapes split across deltas are held back until complete.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._state = "search"  # search -> answer -> done
+
+    def feed(self, delta: str) -> str:
+        if self._state == "done":
+            return ""
+        self._buffer += delta
+        if self._state == "search":
+            match = _ANSWER_START_RE.search(self._buffer)
+            if not match:
+                return ""
+            self._buffer = self._buffer[match.end():]
+            self._state = "answer"
+
+        buf = self._buffer
+        out = []
+        i, n = 0, len(buf)
+        while i < n:
+            run = _PLAIN_RUN_RE.match(buf, i)
+            if run:
+                out.append(run.group())
+                i = run.end()
+                continue
+            if buf[i] == '"':
+                self._state = "done"
+                i = n
+                break
+            # Backslash escape
+            if i + 1 >= n:
+                break
+            esc = buf[i + 1]
+            if esc != "u":
+                out.append(_JSON_ESCAPES.get(esc, esc))
+                i += 2
+                continue
+            end = self._unicode_escape_end(buf, i)
+            if end is None:
+                break
+            try:
+                out.append(orjson.loads(f'"{buf[i:end]}"'))
+            except orjson.JSONDecodeError:
+                out.append(buf[i:end])
+            i = end
+
+        self._buffer = buf[i:]
+        return "".join(out)
+
+    @staticmethod
+    def _unicode_escape_end(buf: str, i: int) -> Optional[int]:
+        """End of the \\uXXXX escape at i (both halves of a surrogate pair), None if incomplete"""
+        end = i + 6
+        if end > len(buf):
+            return None
+        if "d800" <= buf[i + 2:end].lower() <= "dbff":
+            if end + 6 > len(buf):
+                return None
+            if buf[end:end + 2] == "\\u":
+                end += 6
+        return end
+
 class LLMClient:
     def __init__(self, model: str = "llama-3.3-70b-versatile"):
         api_key = os.getenv("GROQ_API_KEY")
         if not api_key:
             raise ValueError("GROQ_API_KEY not set")
         
+        http_client, http_async_client = _shared_http_clients()
         self.llm = ChatGroq(
             api_key=api_key,
             model=model,
             temperature=0.1,
+            http_client=http_client,
+            http_async_client=http_async_client,
         )
 
 #     def generate_json_response(self, query: str, context: str) -> Dict[str, Any]:
@@ -118,12 +261,12 @@ class LLMClient:
             text = text.strip()
             
             # Try to find JSON object in the text
-            json_match = re.search(r'\{.*\}', text, re.DOTALL)
-            if json_match:
-                text = json_match.group(0)
+            span = _outer_json_span(text)
+            if span:
+                text = span
             
             # Parse JSON
-            parsed = json.loads(text)
+            parsed = orjson.loads(text)
             
             # Validate expected keys
             if 'session_name' not in parsed or 'user_query' not in parsed:
@@ -131,7 +274,7 @@ class LLMClient:
             
             return parsed
         
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             raise ValueError(f"Failed to parse JSON response: {e}. Response was: {text[:200]}")
         except Exception as e:
             raise ValueError(f"Error processing response: {e}")
@@ -168,33 +311,59 @@ class LLMClient:
             response = self.llm.invoke(prompt)
             return self._parse_json_response(response.content)
 
+    async def agenerate_json_response(self, prompt):
+        """Async variant of generate_json_response; does not block the event loop."""
+        async with _llm_semaphore:
+            response = await self.llm.ainvoke(prompt)
+        return self._parse_json_response(response.content)
+
+    async def astream_json_response(self, prompt) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Streaming variant of agenerate_json_response.
+
+        Yields ("token", text) for answer text as it arrives, then
+        ("response", parsed) with the full parsed JSON once the stream ends.
+        """
+        decoder = AnswerStreamDecoder()
+        parts = []
+        async with _llm_semaphore:
+            async for chunk in self.llm.astream(prompt):
+                delta = chunk.content
+                if not delta:
+                    continue
+                parts.append(delta)
+                text = decoder.feed(delta)
+                if text:
+                    yield "token", text
+        yield "response", self._parse_json_response("".join(parts))
+
     def _parse_json_response(self, content: str) -> Dict[str, Any]:
         """Robust JSON parser - extracts JSON even from messy LLM output."""
         content = content.strip()
         
-        # Method 1: Find any JSON block
-        json_match = re.search(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', content, re.DOTALL)
-        if json_match:
-            try:
-                return json.loads(json_match.group())
-            except json.JSONDecodeError:
-                pass
+        # Fast path: the response is exactly one JSON object
+        if content.startswith("{"):
+            parsed = _loads_dict(content)
+            if parsed is not None:
+                return parsed
         
-        # Method 2: Clean common LLM formatting junk
-        cleaned = re.sub(r'``````python|``````json|``````\n', '', content).strip()
-        cleaned = re.sub(r'^.*?(?=\{)', '', cleaned, flags=re.DOTALL)  # Remove text before {
-        cleaned = re.sub(r'(?<=\}).*?$', '', cleaned, flags=re.DOTALL)  # Remove text after }
+        # Method 1: Linear brace counter (handles fences / text around the object)
+        block = self._extract_json_block(content)
+        if block:
+            parsed = _loads_dict(block)
+            if parsed is not None:
+                return parsed
         
-        json_match = re.search(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', cleaned, re.DOTALL)
-        if json_match:
-            try:
-                return json.loads(json_match.group())
-            except json.JSONDecodeError:
-                pass
+        # Method 2: Outermost {...} span (e.g. unbalanced braces inside a string)
+        span = _outer_json_span(content, _REGEX_SCAN_LIMIT)
+        if span:
+            parsed = _loads_dict(span)
+            if parsed is not None:
+                return parsed
         
         # Method 3: Fallback - extract key values manually
-        answer_match = re.search(r'"answer"[:\s]*"([^"]*)"', content)
-        citation_match = re.search(r'"citation_required"[:\s]*"([^"]*)"', content)
+        answer_match = _ANSWER_RE.search(content, 0, _REGEX_SCAN_LIMIT)
+        citation_match = _CITATION_REQUIRED_RE.search(content, 0, _REGEX_SCAN_LIMIT)
         
         fallback = {
             "answer": answer_match.group(1) if answer_match else "Error parsing response.",
@@ -203,4 +372,33 @@ class LLMClient:
             "files_used": 0
         }
         
-        return fallback
\ No newline at end of file
+        return fallback
+
+    @staticmethod
+    def _extract_json_block(content: str) -> Optional[str]:
+        """Return the first balanced {...} block, skipping braces inside strings. O(n)."""
+        start = content.find("{")
+        if start == -1:
+            return None
+        
+        depth = 0
+        in_string = False
+        escaped = False
+        for i in range(start, len(content)):
+            ch = content[i]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif ch == "\\":
+                    escaped = True
+                elif ch == '"':
+                    in_string = False
+            elif ch == '"':
+                in_string = True
+            elif ch == "{":
+                depth += 1
+            elif ch == "}":
+                depth -= 1
+                if depth == 0:
+                    return content[start:i + 1]
+        return None
@@ -1,17 +1,81 @@
 # helper/memory.py
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Callable, Awaitable, Sequence
 from datetime import datetime
+import heapq
 import json
+import logging
 import uuid
-from collections import defaultdict
+from collections import defaultdict, deque
+from itertools import islice
+
+import numpy as np
+from rank_bm25 import BM25Okapi
+
+logger = logging.getLogger(__name__)
+
+# Hybrid relevance: weighted sum of min-max normalized BM25 and cosine scores
+BM25_WEIGHT = 0.4
+SEMANTIC_WEIGHT = 0.6
+# Memories without keyword overlap still count as relevant above this cosine
+SEMANTIC_MIN_SIMILARITY = 0.5
+
+
+def _quantize(vector: np.ndarray):
+    """Symmetric int8 scalar quantization: vector ~= q / scale"""
+    scale = 127.0 / max(float(np.abs(vector).max()), 1e-9)
+    return np.round(vector * scale).astype(np.int8), np.float32(scale)
+
+
+def _min_max(scores: np.ndarray) -> np.ndarray:
+    lo, hi = scores.min(), scores.max()
+    if hi - lo < 1e-9:
+        return np.ones_like(scores) if hi > 0 else np.zeros_like(scores)
+    return (scores - lo) / (hi - lo)
+
+
+class _EmbeddingRing:
+    """Fixed (capacity, dim) int8 rows plus scales, overwritten oldest-first once full"""
+    
+    __slots__ = ("matrix", "scales", "next", "count")
+    
+    def __init__(self, capacity: int, dim: int):
+        self.matrix = np.zeros((capacity, dim), dtype=np.int8)
+        self.scales = np.ones(capacity, dtype=np.float32)
+        self.next = 0  # row the next append writes
+        self.count = 0
+    
+    def append(self, q: np.ndarray, scale: np.float32):
+        self.matrix[self.next] = q
+        self.scales[self.next] = scale
+        self.next = (self.next + 1) % len(self.matrix)
+        self.count = min(self.count + 1, len(self.matrix))
+    
+    def scores(self, q: np.ndarray, q_scale: np.float32) -> np.ndarray:
+        """Dequantized dot products with q, oldest row first (the memories' order)"""
+        n = self.count
+        # int32 accumulation: 384 * 127^2 overflows int16
+        raw = (self.matrix[:n].astype(np.int32) @ q.astype(np.int32)) / (self.scales[:n] * q_scale)
+        # Once full the oldest row is the one about to be overwritten
+        return np.roll(raw, -self.next) if n == len(self.matrix) else raw
+
 
 class SimpleMemoryManager:
-    """Pure Python memory manager - no external dependencies"""
+    """In-process memory manager with hybrid BM25 + embedding relevance"""
     
-    def __init__(self, max_memories_per_session: int = 20):
+    def __init__(
+        self,
+        max_memories_per_session: int = 20,
+        embed_fn: Optional[Callable[[str], Awaitable[List[float]]]] = None,
+    ):
         self.max_memories = max_memories_per_session
-        self._session_memories = {}  # {session_id: list of memories}
+        # async text -> vector; keyword-only (BM25) when None.
+        # query_vector given to get_memory_context must be unit length (same embedder)
+        self.embed_fn = embed_fn
+        self._session_memories = {}  # {session_id: deque of memories}
         self._session_summaries = {}  # {session_id: summary}
+        self._session_bm25 = {}  # {session_id: BM25Okapi}, rebuilt lazily after inserts
+        # {session_id: _EmbeddingRing} of quantized unit vectors, rows aligned with memories
+        self._session_embeddings = {}
         
     async def add_to_memory(
         self, 
@@ -22,30 +86,44 @@ class SimpleMemoryManager:
     ):
         """Add conversation to session memory"""
         if session_id not in self._session_memories:
-            self._session_memories[session_id] = []
+            # bounded: the oldest memory is evicted in O(1) once the cap is hit
+            self._session_memories[session_id] = deque(maxlen=self.max_memories)
             self._session_summaries[session_id] = ""
         
-        # Create memory entry
+        # Create memory entry (tokenized/embedded once here instead of on every retrieval)
+        combined_text = f"{user_message} {ai_response}"
+        terms = combined_text.lower().split()
         memory_entry = {
             'id': str(uuid.uuid4()),
             'user_message': user_message,
             'ai_response': ai_response,
             'timestamp': datetime.now().isoformat(),
-            'metadata': metadata or {}
+            'metadata': metadata or {},
+            '_terms': terms,
+            '_tokens': frozenset(terms),
         }
+        embedding = await self._embed(combined_text)
         
-        # Add to memories
+        # Add to memories (deque keeps only the last N)
         self._session_memories[session_id].append(memory_entry)
-        
-        # Keep only last N memories
-        if len(self._session_memories[session_id]) > self.max_memories:
-            self._session_memories[session_id] = self._session_memories[session_id][-self.max_memories:]
+        self._session_bm25.pop(session_id, None)
+        if embedding is not None:
+            self._append_embedding(session_id, embedding)
+        else:
+            # rows must stay aligned with the newest memories; restart the matrix
+            self._session_embeddings.pop(session_id, None)
         
         # Update summary every 5 messages
         if len(self._session_memories[session_id]) % 5 == 0:
             await self._update_summary(session_id)
     
-    async def get_memory_context(self, session_id: str, query: str, limit: int = 5) -> str:
+    async def get_memory_context(
+        self,
+        session_id: str,
+        query: str,
+        limit: int = 5,
+        query_vector: Optional[List[float]] = None,
+    ) -> str:
         """Get relevant memory context for query"""
         if session_id not in self._session_memories:
             return ""
@@ -62,8 +140,10 @@ class SimpleMemoryManager:
         if summary:
             context_parts.append(f"## CONVERSATION SUMMARY\n{summary}")
         
-        # Add relevant memories based on keyword matching
-        relevant = self._find_relevant_memories(memories, query, limit)
+        # Add relevant memories based on hybrid keyword + semantic matching
+        if query_vector is None and query:
+            query_vector = await self._embed(query)
+        relevant = self._find_relevant_memories(session_id, memories, query, limit, query_vector)
         if relevant:
             relevant_text = []
             for memory in relevant:
@@ -74,7 +154,7 @@ class SimpleMemoryManager:
         
         # Add recent memories (if we don't have enough relevant ones)
         if len(relevant) < 3 and len(memories) > 0:
-            recent = memories[-3:]  # Last 3 exchanges
+            recent = islice(memories, max(len(memories) - 3, 0), None)  # Last 3 exchanges
             recent_text = []
             for memory in recent:
                 recent_text.append(f"User: {memory['user_message']}")
@@ -86,30 +166,72 @@ class SimpleMemoryManager:
             return "\n\n".join(context_parts) + "\n\n"
         return ""
     
-    def _find_relevant_memories(self, memories: List[Dict], query: str, limit: int = 5) -> List[Dict]:
-        """Find memories relevant to query using simple keyword matching"""
+    def _find_relevant_memories(
+        self,
+        session_id: str,
+        memories: Sequence[Dict],
+        query: str,
+        limit: int = 5,
+        query_vector: Optional[List[float]] = None,
+    ) -> List[Dict]:
+        """Find memories relevant to query using BM25 fused with embedding similarity"""
         if not memories or not query:
             return []
         
-        query_words = set(query.lower().split())
-        relevant = []
+        query_terms = query.lower().split()
+        query_words = set(query_terms)
         
-        for memory in reversed(memories):  # Most recent first
-            # Check both user message and AI response
-            combined_text = f"{memory['user_message']} {memory['ai_response']}".lower()
-            
-            # Count overlapping words
-            memory_words = set(combined_text.split())
-            overlap = len(query_words.intersection(memory_words))
-            
-            if overlap > 0:
-                relevant.append((memory, overlap))
-                if len(relevant) >= limit:
-                    break
-        
-        # Sort by relevance
-        relevant.sort(key=lambda x: x[1], reverse=True)
-        return [item[0] for item in relevant]
+        bm25 = self._session_bm25.get(session_id)
+        if bm25 is None:
+            bm25 = BM25Okapi([m['_terms'] or [""] for m in memories])
+            self._session_bm25[session_id] = bm25
+        bm25_scores = np.asarray(bm25.get_scores(query_terms), dtype=np.float32)
+        
+        semantic = self._semantic_scores(session_id, query_vector)
+        if semantic is None:
+            scores = _min_max(bm25_scores)
+        else:
+            scores = BM25_WEIGHT * _min_max(bm25_scores) + SEMANTIC_WEIGHT * _min_max(semantic)
+        
+        # Score every candidate, then keep the best `limit` (no recency bias)
+        candidates = []
+        for idx, memory in enumerate(memories):
+            keyword_hit = bool(query_words & memory['_tokens'])
+            semantic_hit = semantic is not None and semantic[idx] >= SEMANTIC_MIN_SIMILARITY
+            if keyword_hit or semantic_hit:
+                candidates.append((idx, scores[idx]))
+        
+        top = heapq.nlargest(limit, candidates, key=lambda t: t[1])
+        return [memories[idx] for idx, _ in top]
+    
+    def _append_embedding(self, session_id: str, embedding: np.ndarray):
+        """Write one quantized row into the session ring, evicting like the memories deque"""
+        ring = self._session_embeddings.get(session_id)
+        if ring is None:
+            ring = _EmbeddingRing(self.max_memories, len(embedding))
+            self._session_embeddings[session_id] = ring
+        ring.append(*_quantize(embedding))
+    
+    def _semantic_scores(self, session_id: str, query_vector: Optional[List[float]]) -> Optional[np.ndarray]:
+        """Cosine similarity of the (unit) query against every memory (None without embeddings)"""
+        if query_vector is None or session_id not in self._session_embeddings:
+            return None
+        ring = self._session_embeddings[session_id]
+        if ring.count != len(self._session_memories.get(session_id, [])):
+            return None  # ring restarted after a failed embedding; keyword scores only
+        # Rows and query are unit length, so the dot product is the cosine
+        return ring.scores(*_quantize(np.asarray(query_vector, dtype=np.float32)))
+    
+    async def _embed(self, text: str) -> Optional[np.ndarray]:
+        if self.embed_fn is None:
+            return None
+        try:
+            vector = np.asarray(await self.embed_fn(text), dtype=np.float32)
+        except Exception as e:
+            logger.warning("Memory embedding failed: %s", e)
+            return None
+        # normalized once here so scoring is a plain dot product
+        return vector / max(float(np.linalg.norm(vector)), 1e-9)
     
     async def _update_summary(self, session_id: str):
         """Create/update summary for session (simplified)"""
@@ -122,7 +244,7 @@ class SimpleMemoryManager:
         
         # Simple summary: extract main topics from last few conversations
         recent_topics = []
-        for memory in memories[-5:]:
+        for memory in islice(memories, max(len(memories) - 5, 0), None):
             user_msg = memory['user_message'][:100]
             recent_topics.append(f"- User asked about: {user_msg}...")
         
@@ -135,6 +257,8 @@ class SimpleMemoryManager:
             del self._session_memories[session_id]
         if session_id in self._session_summaries:
             del self._session_summaries[session_id]
+        self._session_bm25.pop(session_id, None)
+        self._session_embeddings.pop(session_id, None)
         print(f"✓ Cleared memory for session: {session_id}")
     
     def get_session_info(self, session_id: str) -> Dict[str, Any]:
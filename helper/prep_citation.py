@@ -1,14 +1,91 @@
+import hashlib
+import io
 import re
 import os
-from pymilvus import connections, Collection
+import logging
+import subprocess
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from database.milvus import get_collection
+import httpx
+import jinja2
 import pypandoc
+from markdown_it import MarkdownIt
+from markdown_it.common.utils import escapeHtml
+from mdit_py_plugins.container import container_plugin
+from mdit_py_plugins.dollarmath import dollarmath_plugin
+
+logger = logging.getLogger(__name__)
 
 # =========================
 # CONFIG
 # =========================
 
-MILVUS_URI = "http://localhost:19530"
-COLLECTION_NAME = "knowledge_base_v1"
+MILVUS_URI = os.getenv("MILVUS_URI") or "http://localhost:19530"
+COLLECTION_NAME = os.getenv("COLLECTION_NAME", "knowledge_base_v1")
+
+# Resolved once on first use, then shared by every query below
+_COLLECTION = None
+# Field giving document order within a file: chunk_index when the collection has it,
+# otherwise the auto-id primary key (assigned in insertion order, i.e. chunker order)
+_ORDER_FIELD = "chunk_index"
+_milvus_lock = threading.Lock()
+
+# (file_id, chunk_id) -> rendered html path; bump the version when the corpus changes
+CITATION_CACHE_VERSION = os.getenv("CITATION_CACHE_VERSION", "1")
+CITATION_CACHE_SIZE = int(os.getenv("CITATION_CACHE_SIZE", "8192"))
+
+# Compiled once; used per chunk by detect_heading / build_section_markdown
+_HEADING_RE = re.compile(r"^(\d+(?:\.\d+)*)\s+(.*)$", re.MULTILINE)
+_MARKER_RE = re.compile(r"\{\d+\}-+")
+_IMG_RE = re.compile(r"!\[.*?\]\(.*?\)")
+
+# "markdown-it" (in-process, default) or "pandoc" (full pandoc markdown)
+CITATION_MARKDOWN_RENDERER = os.getenv("CITATION_MARKDOWN_RENDERER", "markdown-it")
+
+# `pandoc server` endpoint, e.g. http://127.0.0.1:3030 (empty: one pandoc process per render)
+PANDOC_SERVER_URL = os.getenv("PANDOC_SERVER_URL", "")
+PANDOC_SERVER_AUTOSTART = os.getenv("PANDOC_SERVER_AUTOSTART", "1") == "1"
+_pandoc_client = httpx.Client(timeout=10.0)
+_pandoc_process = None
+
+# Page size for Milvus query iterators
+QUERY_BATCH_SIZE = int(os.getenv("MILVUS_QUERY_BATCH_SIZE", "500"))
+
+# Bounded pool for the per-citation work (Milvus fallback queries, pandoc renders)
+CITATION_WORKERS = int(os.getenv("CITATION_WORKERS", "8"))
+_citation_pool = ThreadPoolExecutor(max_workers=CITATION_WORKERS, thread_name_prefix="citation")
+
+_citation_paths = OrderedDict()
+_citation_paths_lock = threading.Lock()
+
+# =========================
+# HELPER: CITATION PATH CACHE
+# =========================
+
+def _cached_citation_path(file_id, chunk_id):
+    key = (CITATION_CACHE_VERSION, file_id, chunk_id)
+    with _citation_paths_lock:
+        path = _citation_paths.get(key)
+        if path is None:
+            return None
+        # file may have been cleaned up since it was rendered
+        if not os.path.exists(path):
+            del _citation_paths[key]
+            return None
+        _citation_paths.move_to_end(key)
+        return path
+
+
+def _remember_citation_path(file_id, chunk_id, path):
+    key = (CITATION_CACHE_VERSION, file_id, chunk_id)
+    with _citation_paths_lock:
+        _citation_paths[key] = path
+        _citation_paths.move_to_end(key)
+        if len(_citation_paths) > CITATION_CACHE_SIZE:
+            _citation_paths.popitem(last=False)
 
 # =========================
 # HELPER: ESCAPE MILVUS STRING
@@ -31,24 +108,72 @@ def escape_milvus_string(value: str) -> str:
 # MILVUS
 # =========================
 
+def _init_milvus():
+    """Shared, already-loaded collection handle (no connect/load per query)"""
+    global _COLLECTION, _ORDER_FIELD
+    if _COLLECTION is not None:
+        return _COLLECTION
+    with _milvus_lock:
+        if _COLLECTION is None:
+            col = get_collection(COLLECTION_NAME, MILVUS_URI)
+            if "chunk_index" not in {f.name for f in col.schema.fields}:
+                _ORDER_FIELD = col.schema.primary_field.name
+            _COLLECTION = col
+    return _COLLECTION
+
+
+def _section_fields():
+    """Output fields needed to render a section, in document order"""
+    _init_milvus()  # resolves _ORDER_FIELD from the collection schema
+    return [
+        "chunk_id",
+        "text",
+        "page",
+        "header",
+        "relative_img_path",
+        _ORDER_FIELD
+    ]
+
+
+def _document_order(chunk):
+    return chunk.get(_ORDER_FIELD, 0)
+
+
+def _query_all(expr, output_fields):
+    """Page through every match with a query iterator (no silent 10000-row cap)"""
+    col = _init_milvus()
+    it = col.query_iterator(
+        batch_size=QUERY_BATCH_SIZE,
+        expr=expr,
+        output_fields=output_fields
+    )
+    rows = []
+    try:
+        while True:
+            batch = it.next()
+            if not batch:
+                break
+            rows.extend(batch)
+    finally:
+        it.close()
+    return rows
+
+
 def fetch_all_chunks(file_id):
-    connections.connect(uri=MILVUS_URI)
-    col = Collection(COLLECTION_NAME)
-    col.load()
-    
     # Escape file_id (though it's usually safe)
     file_id_escaped = escape_milvus_string(file_id)
     
-    return col.query(
-        expr=f'file_id == "{file_id_escaped}"',
-        output_fields=[
-            "chunk_id",
-            "text",
-            "page",
-            "header",
-            "relative_img_path"
-        ],
-        limit=10000
+    return _query_all(
+        f'file_id == "{file_id_escaped}"',
+        _section_fields()
+    )
+
+
+def fetch_chunk_headers(file_id):
+    """chunk_id/header pairs of a file, without pulling any text"""
+    return _query_all(
+        f'file_id == "{escape_milvus_string(file_id)}"',
+        ["chunk_id", "header"]
     )
 
 
@@ -57,43 +182,90 @@ def fetch_chunks_by_header(file_id, header):
     Fetch chunks by file_id and header.
     Headers may contain special characters like <, >, *, ", etc.
     """
-    connections.connect(uri=MILVUS_URI)
-    col = Collection(COLLECTION_NAME)
-    col.load()
-    
     # Escape both file_id and header
     file_id_escaped = escape_milvus_string(file_id)
     header_escaped = escape_milvus_string(header)
     
     try:
-        return col.query(
-            expr=f'file_id == "{file_id_escaped}" && header == "{header_escaped}"',
-            output_fields=[
-                "chunk_id",
-                "text",
-                "page",
-                "header",
-                "relative_img_path"
-            ],
-            limit=10000
+        return _query_all(
+            f'file_id == "{file_id_escaped}" && header == "{header_escaped}"',
+            _section_fields()
         )
     except Exception as e:
-        print(f"❌ Error querying Milvus with header: {header}")
-        print(f"   Error: {e}")
-        # Fallback: fetch all chunks for this file and filter in Python
-        print("   Falling back to Python filtering...")
-        all_chunks = fetch_all_chunks(file_id)
-        return [c for c in all_chunks if c.get("header") == header]
+        logger.warning("Error querying Milvus with header %r: %s", header, e)
+        # Fallback: match headers in Python, then fetch only those chunks' text
+        logger.warning("Falling back to Python filtering...")
+        chunk_ids = [c["chunk_id"] for c in fetch_chunk_headers(file_id) if c.get("header") == header]
+        if not chunk_ids:
+            return []
+        return _query_all(f"chunk_id in {_in_list(chunk_ids)}", _section_fields())
+
+def fetch_chunk_by_id(chunk_id):
+    """Fetch a single chunk instead of scanning its whole file"""
+    col = _init_milvus()
+
+    rows = col.query(
+        expr=f'chunk_id == "{escape_milvus_string(chunk_id)}"',
+        output_fields=["chunk_id", "text", "header", "page", "relative_img_path"],
+        limit=1
+    )
+    if not rows:
+        raise ValueError(f"Chunk not found: {chunk_id}")
+    return rows[0]
+
+
+def _in_list(values):
+    return "[" + ", ".join(f'"{escape_milvus_string(v)}"' for v in values) + "]"
+
+
+def fetch_chunks_by_ids(chunk_ids):
+    """Fetch several target chunks (any file) in one query"""
+    col = _init_milvus()
+
+    return col.query(
+        expr=f"chunk_id in {_in_list(chunk_ids)}",
+        output_fields=["chunk_id", "file_id", "text", "header"],
+        limit=len(chunk_ids)
+    )
+
+
+def fetch_sections(file_headers):
+    """
+    Fetch the chunks of several (file_id, header) sections in one query.
+
+    Returns:
+        dict mapping (file_id, header) -> list of chunks
+    """
+    file_ids = sorted({f for f, _ in file_headers})
+    headers = sorted({h for _, h in file_headers})
+    sections = {pair: [] for pair in file_headers}
+
+    # the cross product may over-fetch, so keep only the requested pairs
+    rows = _query_all(
+        f"file_id in {_in_list(file_ids)} && header in {_in_list(headers)}",
+        _section_fields() + ["file_id"]
+    )
+    for c in rows:
+        key = (c["file_id"], c.get("header"))
+        if key in sections:
+            sections[key].append(c)
+    return sections
 
 # =========================
 # HEADING
 # =========================
 
 def detect_heading(chunk):
-    if chunk.get("header"):
-        return chunk["header"].strip()
+    return _heading_for(chunk["text"], chunk.get("header"))
+
+
+@lru_cache(maxsize=512)
+def _heading_for(text, header):
+    # memoized: the numbered-heading fallback scans the whole chunk text
+    if header:
+        return header.strip()
 
-    m = re.search(r"^(\d+(?:\.\d+)*)\s+(.*)$", chunk["text"], re.MULTILINE)
+    m = _HEADING_RE.search(text)
     if m:
         return m.group(2).strip()
 
@@ -104,46 +276,82 @@ def detect_heading(chunk):
 # =========================
 
 def build_section_markdown(chunks, target_chunk_id, heading):
-    md = []
-    md.append(f"# {heading}\n")
+    # every block after the title is written as "\n" + block (blank line between blocks)
+    buf = io.StringIO()
+    w = buf.write
+    w(f"# {heading}\n")
 
     last_page = None
 
-    for c in sorted(chunks, key=lambda x: x["chunk_id"]):
+    # chunk_ids only sort in document order for newer ingests (older ones are
+    # chk_<uuid4>), so order by the chunk_index / insertion ordinal instead
+    for c in sorted(chunks, key=_document_order):
         page_meta = c["page"]
 
         # logical page break when metadata page changes
         if last_page and page_meta != last_page:
-            md.append("\n<div class='page-break'></div>\n")
+            w("\n\n<div class='page-break'></div>\n")
         last_page = page_meta
 
         # source page label
-        md.append(f"<div class='source-page'>Source page: {page_meta}</div>\n")
+        w(f"\n<div class='source-page'>Source page: {page_meta}</div>\n")
 
-        text = re.sub(r"\{\d+\}-+", "", c["text"]).strip()
+        text = _MARKER_RE.sub("", c["text"]).strip()
 
         # fix image path (ABSOLUTE FILE URL)
         if c.get("relative_img_path"):
             img_path = c["relative_img_path"].replace("\\", "/")
-            text = re.sub(
-                r"!\[.*?\]\(.*?\)",
-                f"![](file:///{img_path})",
-                text
-            )
+            text = _IMG_RE.sub(f"![](file:///{img_path})", text)
 
         # highlight target chunk
+        w("\n")
         if c["chunk_id"] == target_chunk_id:
-            md.append(f"::: highlight\n{text}\n:::\n")
+            w(f"::: highlight\n{text}\n:::\n")
         else:
-            md.append(text + "\n")
+            w(text)
+            w("\n")
 
-    return "\n".join(md)
+    return buf.getvalue()
 
 # =========================
 # MARKDOWN → HTML
 # =========================
 
+def _math_renderer(content, config):
+    # plugin wraps this in <span class="math inline"> / <div class="math block">;
+    # add the delimiters pandoc --mathjax emits so MathJax typesets it client-side
+    if config["display_mode"]:
+        return f"\\[{escapeHtml(content)}\\]"
+    return f"\\({escapeHtml(content)}\\)"
+
+
+# in-process renderer for the features sections use: tables, images, inline html,
+# ::: highlight containers and $math$
+_MD = (
+    MarkdownIt("commonmark", {"html": True})
+    .enable("table")
+    .use(container_plugin, "highlight")
+    .use(dollarmath_plugin, renderer=_math_renderer)
+)
+
+
 def markdown_to_html(md_text):
+    if CITATION_MARKDOWN_RENDERER == "markdown-it":
+        try:
+            return _MD.render(md_text)
+        except Exception as e:
+            logger.warning("markdown-it render failed (%s), using pandoc", e)
+    return _pandoc_to_html(md_text)
+
+
+def _pandoc_to_html(md_text):
+    # long-lived `pandoc server` avoids a pandoc fork/exec per citation
+    if PANDOC_SERVER_URL:
+        try:
+            return _pandoc_server_convert(md_text)
+        except Exception as e:
+            logger.warning("pandoc server unavailable (%s), using pandoc subprocess", e)
+
     return pypandoc.convert_text(
         md_text,
         to="html",
@@ -154,106 +362,248 @@ def markdown_to_html(md_text):
         ]
     )
 
+
+def _pandoc_server_convert(md_text):
+    response = _pandoc_client.post(
+        PANDOC_SERVER_URL,
+        json={
+            "text": md_text,
+            "from": "markdown",
+            "to": "html",
+            "html-math-method": "mathjax",
+            "wrap": "preserve",
+        },
+        headers={"Accept": "text/plain"},
+    )
+    response.raise_for_status()
+    return response.text
+
+
+def start_pandoc_server():
+    """
+    Launch `pandoc server` on PANDOC_SERVER_URL's port (when autostart is on).
+
+    Call it from one process only: with several workers, `python main.py` starts it
+    before spawning them and turns autostart off for the workers.
+    """
+    global _pandoc_process
+    if not (PANDOC_SERVER_URL and PANDOC_SERVER_AUTOSTART) or _pandoc_process:
+        return
+    port = str(httpx.URL(PANDOC_SERVER_URL).port or 3030)
+    _pandoc_process = subprocess.Popen(
+        [pypandoc.get_pandoc_path(), "server", "--port", port],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    logger.info("pandoc server started on port %s (pid %d)", port, _pandoc_process.pid)
+
+
+def stop_pandoc_server():
+    """Terminate the pandoc server started by start_pandoc_server"""
+    global _pandoc_process
+    _pandoc_client.close()
+    if _pandoc_process:
+        _pandoc_process.terminate()
+        _pandoc_process = None
+
 # =========================
 # MAIN
 # =========================
 
-def create_section_html_from_chunk(file_id, target_chunk_id):
+def citation_output_path(file_id, target_chunk_id):
     citations_dir = os.path.abspath("citations")
     os.makedirs(citations_dir, exist_ok=True)
 
-    # build filename safely
-    file_stub = f"{file_id[:5]}{str(target_chunk_id)[-5:]}"
-    OUTPUT_HTML = os.path.join(
+    # build filename safely: hash of the full ids, since id prefixes and
+    # suffixes (chunk ids end in the chunk index) are shared across documents
+    file_stub = hashlib.blake2b(
+        f"{file_id}\x00{target_chunk_id}".encode("utf-8"), digest_size=10
+    ).hexdigest()
+    return os.path.join(
         citations_dir,
         f"{file_stub}_citation.html"
     )
-    
-    print("📥 Fetching chunks...")
-    all_chunks = fetch_all_chunks(file_id)
-
-    target = next(c for c in all_chunks if c["chunk_id"] == target_chunk_id)
-    heading = detect_heading(target)
-    print("📌 Heading:", heading)
 
-    section_chunks = fetch_chunks_by_header(file_id, heading)
-    print(f"📄 {len(section_chunks)} chunks found")
-
-    md = build_section_markdown(section_chunks, target_chunk_id, heading)
-    html_body = markdown_to_html(md)
 
-    final_html = f"""
+_CITATION_HTML_SRC = """
 <!DOCTYPE html>
 <html>
 <head>
   <meta charset="utf-8">
-  <title>{heading}</title>
+  <title>{{ heading }}</title>
 
   <!-- MathJax -->
   <script src="https://cdn.jsdelivr.net/npm/mathjax@3/es5/tex-mml-chtml.js"></script>
 
   <style>
-    body {{
+    body {
       font-family: Georgia, serif;
       line-height: 1.65;
       margin: 40px;
       max-width: 900px;
-    }}
+    }
 
-    h1 {{ font-size: 28px; }}
-    h2 {{ font-size: 22px; }}
-    h3 {{ font-size: 18px; }}
+    h1 { font-size: 28px; }
+    h2 { font-size: 22px; }
+    h3 { font-size: 18px; }
 
-    .source-page {{
+    .source-page {
       font-size: 12px;
       color: #555;
       margin: 10px 0;
-    }}
+    }
 
-    .highlight {{
+    .highlight {
       background: #fff59d;
       padding: 12px;
       border-radius: 4px;
       margin: 12px 0;
-    }}
+    }
 
-    img {{
+    img {
       max-width: 100%;
       display: block;
       margin: 16px auto;
-    }}
+    }
 
-    table {{
+    table {
       border-collapse: collapse;
       margin: 16px 0;
       width: 100%;
-    }}
+    }
 
-    th, td {{
+    th, td {
       border: 1px solid #ccc;
       padding: 6px 10px;
-    }}
+    }
 
-    .page-break {{
+    .page-break {
       margin: 40px 0;
       border-top: 1px dashed #aaa;
-    }}
+    }
   </style>
 </head>
 <body>
 
-{html_body}
+{{ body }}
 
 </body>
 </html>
 """
 
-    with open(OUTPUT_HTML, "w", encoding="utf-8") as f:
+# compiled once at import; renders are plain string concatenation
+_CITATION_TEMPLATE = jinja2.Template(_CITATION_HTML_SRC, keep_trailing_newline=True)
+
+
+def render_citation_html(heading, html_body):
+    """Wrap a rendered section in the standalone citation page"""
+    return _CITATION_TEMPLATE.render(heading=heading, body=html_body)
+
+
+def write_section_html(section_chunks, target_chunk_id, heading, output_html):
+    md = build_section_markdown(section_chunks, target_chunk_id, heading)
+    html_body = markdown_to_html(md)
+    final_html = render_citation_html(heading, html_body)
+
+    with open(output_html, "w", encoding="utf-8") as f:
         f.write(final_html)
 
-    print("✅ HTML created →", OUTPUT_HTML)
+    logger.debug("HTML created -> %s", output_html)
+
+    return output_html
+
+
+def create_section_html_from_chunk(file_id, target_chunk_id):
+    cached = _cached_citation_path(file_id, target_chunk_id)
+    if cached:
+        return cached
+
+    OUTPUT_HTML = citation_output_path(file_id, target_chunk_id)
+    
+    logger.debug("Fetching chunk %s", target_chunk_id)
+    target = fetch_chunk_by_id(target_chunk_id)
+    heading = detect_heading(target)
+    logger.debug("Heading: %s", heading)
+
+    section_chunks = fetch_chunks_by_header(file_id, heading)
+    logger.debug("%d chunks found", len(section_chunks))
+
+    path = write_section_html(section_chunks, target_chunk_id, heading, OUTPUT_HTML)
+    _remember_citation_path(file_id, target_chunk_id, path)
+    return path
+
+
+def create_section_html_from_listchunks(pairs):
+    """
+    Batched variant of create_section_html_from_chunk.
+
+    Args:
+        pairs: list of (file_id, chunk_id) tuples
+
+    Returns:
+        List of HTML paths aligned with `pairs` (None where a citation failed)
+    """
+    paths = {}
+
+    # only render what is not cached
+    todo = []
+    for file_id, chunk_id in pairs:
+        cached = _cached_citation_path(file_id, chunk_id)
+        if cached:
+            paths[(file_id, chunk_id)] = cached
+        elif (file_id, chunk_id) not in todo:
+            todo.append((file_id, chunk_id))
+
+    if not todo:
+        return [paths.get(pair) for pair in pairs]
+
+    # round trip 1: resolve every target chunk and its heading
+    try:
+        targets = fetch_chunks_by_ids([chunk_id for _, chunk_id in todo])
+    except Exception as e:
+        logger.warning("Error fetching target chunks: %s", e)
+        return [paths.get(pair) for pair in pairs]
+    by_id = {c["chunk_id"]: c for c in targets}
+
+    headings = {}
+    for file_id, chunk_id in todo:
+        try:
+            headings[(file_id, chunk_id)] = detect_heading(by_id[chunk_id])
+        except Exception as e:
+            logger.warning("Error detecting heading for %s: %s", chunk_id, e)
+
+    # round trip 2: every section those headings belong to
+    file_headers = {(file_id, heading) for (file_id, _), heading in headings.items()}
+    try:
+        sections = fetch_sections(file_headers)
+    except Exception as e:
+        logger.warning("Batched section query failed (%s), querying per section", e)
+        file_headers = list(file_headers)
+        sections = dict(zip(
+            file_headers,
+            _citation_pool.map(lambda fh: fetch_chunks_by_header(*fh), file_headers)
+        ))
+
+    # pandoc conversion + file write per citation are independent; run them concurrently
+    def render(item):
+        (file_id, chunk_id), heading = item
+        try:
+            return (file_id, chunk_id), write_section_html(
+                sections[(file_id, heading)],
+                chunk_id,
+                heading,
+                citation_output_path(file_id, chunk_id)
+            )
+        except Exception as e:
+            logger.warning("Error creating citation for %s: %s", chunk_id, e)
+            return (file_id, chunk_id), None
+
+    for pair, path in _citation_pool.map(render, headings.items()):
+        if path:
+            paths[pair] = path
+            _remember_citation_path(*pair, path)
 
-    return OUTPUT_HTML
+    return [paths.get(pair) for pair in pairs]
 
 
 # =======================
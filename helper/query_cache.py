@@ -0,0 +1,84 @@
+# helper/query_cache.py
+import asyncio
+import hashlib
+import os
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+from cachetools import TTLCache
+from dotenv import load_dotenv
+
+load_dotenv()
+
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "4096"))
+QUERY_CACHE_TTL_SECONDS = int(os.getenv("QUERY_CACHE_TTL_SECONDS", "300"))
+QUERY_CACHE_THRESHOLD = float(os.getenv("QUERY_CACHE_THRESHOLD", "0.95"))
+# Semantic tier only compares against this many recent queries of the session
+QUERY_CACHE_RECENT_K = int(os.getenv("QUERY_CACHE_RECENT_K", "32"))
+
+
+class QueryCache:
+    """
+    Per-session response cache in front of the RAG pipeline.
+
+    Tier 1: exact match on the normalized query text.
+    Tier 2: cosine similarity against the session's last K cached queries.
+    Entries expire after a short TTL, since answers depend on conversation memory.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[str], Awaitable[List[float]]],
+        maxsize: int = QUERY_CACHE_SIZE,
+        ttl_seconds: int = QUERY_CACHE_TTL_SECONDS,
+        threshold: float = QUERY_CACHE_THRESHOLD,
+        recent_k: int = QUERY_CACHE_RECENT_K,
+    ):
+        self.embed_fn = embed_fn  # must return unit vectors (dot product == cosine)
+        self.threshold = threshold
+        self.recent_k = recent_k
+        self._exact = TTLCache(maxsize=maxsize, ttl=ttl_seconds)  # key -> result
+        self._recent = TTLCache(maxsize=maxsize, ttl=ttl_seconds)  # session_id -> deque[(vector, key)]
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def _key(session_id: str, query: str) -> str:
+        normalized = query.strip().lower()
+        return hashlib.blake2b(f"{session_id}\x00{normalized}".encode("utf-8"), digest_size=16).hexdigest()
+
+    # ---- public API ----
+    async def get(self, session_id: str, query: str) -> Optional[Dict[str, Any]]:
+        """Cached result for this (or a near-identical) query in the session"""
+        key = self._key(session_id, query)
+        async with self._lock:
+            result = self._exact.get(key)
+            recent = list(self._recent.get(session_id, ()))
+        if result is not None or not recent:
+            return result
+
+        vector = np.asarray(await self.embed_fn(query), dtype=np.float32)
+        similarities = np.stack([v for v, _ in recent]) @ vector
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            return None
+        async with self._lock:
+            return self._exact.get(recent[best][1])
+
+    async def set(self, session_id: str, query: str, result: Dict[str, Any]):
+        """Cache a pipeline result for the session"""
+        key = self._key(session_id, query)
+        vector = np.asarray(await self.embed_fn(query), dtype=np.float32)
+        async with self._lock:
+            self._exact[key] = result
+            recent = self._recent.get(session_id)
+            if recent is None:
+                recent = deque(maxlen=self.recent_k)
+            recent.append((vector, key))
+            self._recent[session_id] = recent  # re-set to refresh the TTL
+
+    async def invalidate_session(self, session_id: str):
+        """Drop a session's entries (e.g. after its memory is cleared)"""
+        async with self._lock:
+            for _, key in self._recent.pop(session_id, ()):
+                self._exact.pop(key, None)
@@ -1,11 +1,117 @@
 # helper/retriver_engine.py
 from __future__ import annotations
 
-from typing import List, Dict, Any, Optional
-
-from pymilvus import connections, Collection
-from langchain_huggingface import HuggingFaceEmbeddings  # ← ye use karo
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict, namedtuple
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple
+
+from langchain_huggingface import HuggingFaceEmbeddings
+from dotenv import load_dotenv
+
+from database.milvus import get_collection
+from helper.batched_embedder import BatchedEmbedder
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Search knobs. The metric is only a fallback: searches use the one the collection's
+# vector index was built with (see index_metric_type)
+MILVUS_METRIC_TYPE = os.getenv("MILVUS_METRIC_TYPE", "IP")
+MILVUS_SEARCH_EF = int(os.getenv("MILVUS_SEARCH_EF", "50"))  # HNSW latency/recall trade-off
+MILVUS_SEARCH_NPROBE = int(os.getenv("MILVUS_SEARCH_NPROBE", "10"))  # IVF indexes only
+# Embedding backend: "torch" (default) or "onnx" for the int8-quantized export
+# (VNNI kernels on AVX-512 CPUs); needs sentence-transformers[onnx] installed
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "onnx/model_qint8_avx512_vnni.onnx")
+EMBEDDING_ONNX_PROVIDER = os.getenv("EMBEDDING_ONNX_PROVIDER", "CPUExecutionProvider")
+# Citation rules allow at most 3 citations; retrieval always covers them
+MAX_CITATION_LIMIT = 3
+
+EmbeddingCacheInfo = namedtuple("EmbeddingCacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+
+def index_metric_type(collection, field_name: str = "vector") -> str:
+    """
+    Metric of the collection's vector index (MILVUS_METRIC_TYPE if it has none).
+
+    Milvus rejects searches whose metric differs from the index's, so a collection
+    built before the IP default keeps searching with L2. To switch it, rebuild the
+    index: python -m utils.milvus_index --metric IP
+    """
+    for index in collection.indexes:
+        if index.field_name == field_name:
+            metric = index.params.get("metric_type")
+            if metric:
+                if metric != MILVUS_METRIC_TYPE:
+                    logger.warning(
+                        "Collection %s is indexed with %s, not MILVUS_METRIC_TYPE=%s; searching "
+                        "with %s (rebuild with utils/milvus_index.py --metric %s to switch)",
+                        collection.name, metric, MILVUS_METRIC_TYPE, metric, MILVUS_METRIC_TYPE,
+                    )
+                return metric
+    return MILVUS_METRIC_TYPE
+
+
+def _embedding_model_kwargs() -> Dict[str, Any]:
+    """SentenceTransformer kwargs for the configured embedding backend"""
+    if EMBEDDING_BACKEND != "onnx":
+        return {}
+    return {
+        "backend": "onnx",
+        "model_kwargs": {
+            "file_name": EMBEDDING_ONNX_FILE,
+            "provider": EMBEDDING_ONNX_PROVIDER,
+        },
+    }
+
+
+@lru_cache(maxsize=None)
+def get_embedder(model_name: str) -> HuggingFaceEmbeddings:
+    """Process-wide embedding model per name (loading MiniLM takes seconds)"""
+    # LangChain HF Embeddings (384 dim), unit-normalized so IP == cosine
+    return HuggingFaceEmbeddings(
+        model_name=model_name,
+        model_kwargs=_embedding_model_kwargs(),
+        encode_kwargs={"normalize_embeddings": True, "batch_size": 32},
+    )
+
+
+@dataclass(slots=True)
+class Chunks:
+    """Retrieved chunks as parallel lists (struct-of-arrays), in rank order."""
+    chunk_ids: List[str] = field(default_factory=list)
+    file_ids: List[str] = field(default_factory=list)
+    texts: List[str] = field(default_factory=list)
+    scores: List[float] = field(default_factory=list)  # raw Milvus distance
+    headers: List[str] = field(default_factory=list)  # header, falling back to subheader
+    pages: List[str] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.chunk_ids)
+
+    def __getitem__(self, index: slice) -> "Chunks":
+        return Chunks(
+            self.chunk_ids[index],
+            self.file_ids[index],
+            self.texts[index],
+            self.scores[index],
+            self.headers[index],
+            self.pages[index],
+        )
 
+    def append(self, chunk_id: str, file_id: str, text: str, score: float, header: str, page: str):
+        self.chunk_ids.append(chunk_id)
+        self.file_ids.append(file_id)
+        self.texts.append(text)
+        self.scores.append(score)
+        self.headers.append(header)
+        self.pages.append(page)
 
 
 class RetrieverEngine:
@@ -14,108 +120,129 @@ class RetrieverEngine:
         milvus_uri: str = "http://localhost:19530",
         collection_name: str = "knowledge_base_v1",
         embedding_model: str = "all-MiniLM-L12-v2",
+        embedding_cache_size: int = 4096,
     ):
-        # LangChain HF Embeddings (384 dim)
-        self.embedding_model = HuggingFaceEmbeddings(
-            model_name=embedding_model
-        )
+        self.embedding_model = get_embedder(embedding_model)
+
+        # LRU of query embeddings keyed on a content hash of the query text
+        self._embedding_cache: "OrderedDict[str, Tuple[float, ...]]" = OrderedDict()
+        self._embedding_cache_size = embedding_cache_size
+        self._embedding_cache_lock = threading.Lock()
+        self._embedding_hits = 0
+        self._embedding_misses = 0
+
+        # Concurrent requests share one encode call (embed_documents batches internally)
+        self._batched_embedder = BatchedEmbedder(self.embedding_model.embed_documents)
         
-        # Milvus connection
-        from pymilvus import connections, Collection
-        connections.connect(alias="default", host='localhost', port='19530')
-        self.collection = Collection(collection_name)
-        self.collection.load()
+        # Milvus connection (shared handle, loaded once per process)
+        self.collection = get_collection(collection_name, milvus_uri)
+        self.metric_type = index_metric_type(self.collection)
 
     # ---- public API ----
-    def get_retrieval_context(self, query: str, limit: int = 10):
-        primary = self.search_similar_chunks(query, limit=limit)  # Pass limit
+    def get_retrieval_context(
+        self,
+        query: str,
+        limit: int = 10,
+        query_vector: Optional[List[float]] = None,
+    ):
+        # Fetch enough for citations too, so callers can slice instead of re-querying
+        limit = max(limit, MAX_CITATION_LIMIT)
+        primary = self.search_similar_chunks(query, limit=limit, query_vector=query_vector)  # Pass limit
         return {
             "chunks": primary,
             "primary_chunks_count": len(primary),
             "total_chunks_retrieved": len(primary),
         }
 
-    # ---- internal ----
-    def _embed_query(self, text: str) -> List[float]:
-        vec = self.embedder.encode(text)
-        return vec.tolist()
-
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a query, reusing cached vectors for repeated queries"""
+        key = self._embedding_key(text)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+
+        vector = self.embedding_model.embed_query(text)
+        self._cache_put(key, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Async embed_query; cache misses are encoded in micro-batches across requests"""
+        key = self._embedding_key(text)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+
+        vector = await self._batched_embedder.embed(text)
+        self._cache_put(key, vector)
+        return vector
+
+    def cache_info(self) -> EmbeddingCacheInfo:
+        """Query embedding cache statistics (same shape as functools.lru_cache)"""
+        with self._embedding_cache_lock:
+            return EmbeddingCacheInfo(
+                self._embedding_hits,
+                self._embedding_misses,
+                self._embedding_cache_size,
+                len(self._embedding_cache),
+            )
 
-    def search_similar_chunks(self, query: str, limit: int = 10):
-        query_embedding = self.embedding_model.embed_query(query)
+    # ---- internal ----
+    @staticmethod
+    def _embedding_key(text: str) -> str:
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+    def _cache_get(self, key: str) -> Optional[List[float]]:
+        with self._embedding_cache_lock:
+            cached = self._embedding_cache.get(key)
+            if cached is not None:
+                self._embedding_cache.move_to_end(key)
+                self._embedding_hits += 1
+                return list(cached)
+            self._embedding_misses += 1
+            return None
+
+    def _cache_put(self, key: str, vector: List[float]):
+        with self._embedding_cache_lock:
+            self._embedding_cache[key] = tuple(vector)
+            self._embedding_cache.move_to_end(key)
+            if len(self._embedding_cache) > self._embedding_cache_size:
+                self._embedding_cache.popitem(last=False)
+
+    def search_similar_chunks(
+        self,
+        query: str,
+        limit: int = 10,
+        query_vector: Optional[List[float]] = None,
+    ):
+        query_embedding = query_vector if query_vector is not None else self.embed_query(query)
         
         results = self.collection.search(
             data=[query_embedding],
             anns_field="vector",
-            param={"params": {"nprobe": 10}},
+            param={
+                "metric_type": self.metric_type,
+                "params": {"ef": max(MILVUS_SEARCH_EF, limit), "nprobe": MILVUS_SEARCH_NPROBE},
+            },
             limit=limit,  # ✅ Dynamic limit
             output_fields=["text", "header", "subheader", "page", "chunk_id", "file_id", "chunk_size"]
         )
         
-        chunks = []
+        chunks = Chunks()
         for hits in results:
             for hit in hits:
-                chunks.append({
-                    "id": hit.id,
-                    "distance": hit.distance,
-                    "text": hit.entity.get("text", ""),
-                    "metadata": {
-                        "header": hit.entity.get("header", ""),
-                        "subheader": hit.entity.get("subheader", ""),
-                        "page": hit.entity.get("page", ""),
-                        "chunk_id": hit.entity.get("chunk_id", ""),
-                        "file_id": hit.entity.get("file_id", ""),
-                        "chunk_size": hit.entity.get("chunk_size", 0),
-                    }
-                })
+                entity = hit.entity
+                chunks.append(
+                    chunk_id=entity.get("chunk_id", ""),
+                    file_id=entity.get("file_id", ""),
+                    text=entity.get("text", ""),
+                    score=hit.distance,
+                    header=entity.get("header") or entity.get("subheader") or "",
+                    page=entity.get("page", ""),
+                )
         return chunks
 
-
-
-    def _augment_by_header(self, primary: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Fetch more chunks with same file_id+header as top hit."""
-        if not primary:
-            return []
-
-        top = primary[0]["metadata"]
-        file_id = top.get("file_id")
-        header = top.get("header")
-
-        expr_parts = []
-        if file_id:
-            expr_parts.append(f'metadata["file_id"] == "{file_id}"')
-        if header:
-            expr_parts.append(f'metadata["header"] == "{header}"')
-        if not expr_parts:
-            return primary
-
-        expr = " and ".join(expr_parts)
-
-        extra = self.collection.query(
-            expr=expr,
-            output_fields=["text", "metadata"],
-            limit=20,
-        )
-
-        existing_ids = {
-            c["metadata"].get("chunk_id") for c in primary if c["metadata"].get("chunk_id")
-        }
-        for e in extra:
-            md = e.get("metadata", {})
-            if md.get("chunk_id") in existing_ids:
-                continue
-            primary.append(
-                {
-                    "text": e.get("text", ""),
-                    "metadata": md,
-                    "similarity_score": 0.0,  # treat as context, not ranked
-                }
-            )
-
-        return primary
-    
     # helper/retriver_engine.py ke andar
-    def get_chunks_for_query(self, query: str):
+    def get_chunks_for_query(self, query: str) -> Chunks:
         """Legacy method for tools"""
         ctx = self.get_retrieval_context(query)
         return ctx["chunks"]
@@ -0,0 +1,128 @@
+# helper/semantic_cache.py
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Any, Optional, List
+
+from pymilvus import Collection, CollectionSchema, DataType, FieldSchema, utility
+from dotenv import load_dotenv
+
+from database.milvus import connect_milvus, get_collection
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+SEMANTIC_CACHE_COLLECTION = os.getenv("SEMANTIC_CACHE_COLLECTION", "semantic_cache_v1")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_TTL_SECONDS = int(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+SEMANTIC_CACHE_EF = int(os.getenv("SEMANTIC_CACHE_EF", "50"))
+
+# Milvus VARCHAR upper bound; larger payloads are simply not cached
+MAX_PAYLOAD_LENGTH = 65535
+
+
+class SemanticCache:
+    """Answer cache keyed on query embedding similarity, stored in its own Milvus collection"""
+
+    def __init__(
+        self,
+        dim: int = 384,
+        collection_name: str = SEMANTIC_CACHE_COLLECTION,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        ttl_seconds: int = SEMANTIC_CACHE_TTL_SECONDS,
+        ef: int = SEMANTIC_CACHE_EF,
+    ):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.ef = ef
+        # lookup runs in worker threads; += on the counters is not atomic
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        connect_milvus()
+        if not utility.has_collection(collection_name):
+            self._create_collection(collection_name, dim)
+
+        self.collection = get_collection(collection_name)
+
+    def _create_collection(self, collection_name: str, dim: int):
+        """Create the cache collection with an HNSW cosine index and native TTL"""
+        fields = [
+            FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
+            FieldSchema(name="vector", dtype=DataType.FLOAT_VECTOR, dim=dim),
+            FieldSchema(name="answer_json", dtype=DataType.VARCHAR, max_length=MAX_PAYLOAD_LENGTH),
+            FieldSchema(name="citations", dtype=DataType.VARCHAR, max_length=MAX_PAYLOAD_LENGTH),
+            FieldSchema(name="created_at", dtype=DataType.INT64),
+        ]
+        schema = CollectionSchema(fields, description="Semantic response cache")
+        collection = Collection(
+            collection_name,
+            schema,
+            properties={"collection.ttl.seconds": self.ttl_seconds},
+        )
+        collection.create_index(
+            "vector",
+            {"index_type": "HNSW", "metric_type": "COSINE", "params": {"M": 16, "efConstruction": 200}},
+        )
+        logger.info("Created semantic cache collection: %s", collection_name)
+
+    # ---- public API ----
+    def lookup(self, query_vector: List[float]) -> Optional[Dict[str, Any]]:
+        """Return the cached result for the most similar query, if above threshold"""
+        # TTL compaction is lazy in Milvus, so expired rows are filtered explicitly too
+        cutoff = int(time.time()) - self.ttl_seconds
+        results = self.collection.search(
+            data=[query_vector],
+            anns_field="vector",
+            param={"metric_type": "COSINE", "params": {"ef": self.ef}},
+            limit=1,
+            expr=f"created_at >= {cutoff}",
+            output_fields=["answer_json", "citations"],
+        )
+
+        for hits in results:
+            for hit in hits:
+                if hit.distance >= self.threshold:
+                    with self._stats_lock:
+                        self.hits += 1
+                    cached = json.loads(hit.entity.get("answer_json"))
+                    cached["citations"] = json.loads(hit.entity.get("citations"))
+                    return cached
+
+        with self._stats_lock:
+            self.misses += 1
+        return None
+
+    def store(self, query_vector: List[float], result: Dict[str, Any]):
+        """Cache a process_query result (session specific fields are dropped)"""
+        payload = {
+            k: v for k, v in result.items()
+            if k not in ("citations", "query", "session_id", "memory_used")
+        }
+        answer_json = json.dumps(payload)
+        citations = json.dumps(result.get("citations", []))
+        if len(answer_json) > MAX_PAYLOAD_LENGTH or len(citations) > MAX_PAYLOAD_LENGTH:
+            return
+
+        self.collection.insert([
+            [query_vector],
+            [answer_json],
+            [citations],
+            [int(time.time())],
+        ])
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for this process"""
+        with self._stats_lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0,
+            "threshold": self.threshold,
+        }
@@ -1,13 +1,32 @@
 # helpers/session_manager.py
+import os
 from datetime import datetime
-from typing import Optional, List
-from sqlalchemy import select, update, delete, desc
+from cachetools import TTLCache
+from typing import Optional, List, Dict
+from sqlalchemy import Row, select, update, delete, desc, func
 from sqlalchemy.ext.asyncio import AsyncSession
-from schemas.chat_models import ChatSessionDB, ChatMessageDB, ChatSession, ChatMessage
+from sqlalchemy.orm import selectinload
+from schemas.chat_models import ChatSessionDB, ChatMessageDB, ChatSession, ChatMessage, utcnow
 from database.postgres import get_async_session
 import uuid
-import json
-from helper.llm import LLMClient
+from helper.llm import LLMClient, get_llm_client
+
+# get_session is hit several times per request burst; rows are cached briefly per process
+# (update_session/delete_session invalidate only this worker's copy, so other workers may
+# serve a stale row for up to the TTL; add_messages re-checks the session in the database)
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "10000"))
+SESSION_CACHE_TTL_SECONDS = float(os.getenv("SESSION_CACHE_TTL_SECONDS", "5"))
+_session_cache = TTLCache(maxsize=SESSION_CACHE_SIZE, ttl=SESSION_CACHE_TTL_SECONDS)
+
+# Columns the session listings need; selecting them returns plain Rows (tuple access)
+# instead of instrumented ORM objects
+SESSION_LIST_COLUMNS = (
+    ChatSessionDB.session_id,
+    ChatSessionDB.session_name,
+    ChatSessionDB.user_id,
+    ChatSessionDB.created_at,
+    ChatSessionDB.updated_at,
+)
 
 class SessionManager:
     def __init__(
@@ -20,7 +39,7 @@ class SessionManager:
     async def generate_session_name(first_query: str, groq_model: str = "llama-3.3-70b-versatile") -> str:
         """Generate session name from first query"""
         try:
-            llm_client = LLMClient(groq_model)
+            llm_client = get_llm_client(groq_model)
             llm_response = llm_client.session_name(first_query)
             # llm_response is a dict with keys: 'session_name' and 'user_query'
             return llm_response.get('session_name')
@@ -47,9 +66,9 @@ class SessionManager:
                 session_id=session_id,
                 user_id=user_id,
                 session_name=session_name,
-                session_info=json.dumps(metadata or {}),  # ← Changed: use session_info
-                created_at=datetime.utcnow(),
-                updated_at=datetime.utcnow()
+                session_info=metadata or {},
+                created_at=utcnow(),
+                updated_at=utcnow()
             )
             db_session.add(new_session)
             await db_session.commit()
@@ -58,24 +77,30 @@ class SessionManager:
     
     @staticmethod
     async def get_session(session_id: str) -> Optional[ChatSessionDB]:
-        """Get session by ID"""
+        """Get session by ID (served from a short per-process TTL cache; treat as read-only)"""
+        session = _session_cache.get(session_id)
+        if session is not None:
+            return session
         async with get_async_session() as db_session:
             result = await db_session.execute(
                 select(ChatSessionDB).where(ChatSessionDB.session_id == session_id)
             )
-            return result.scalar_one_or_none()
+            session = result.scalar_one_or_none()
+        if session is not None:
+            _session_cache[session_id] = session
+        return session
     
     @staticmethod
-    async def get_all_sessions(limit: int = 100, offset: int = 0) -> List[ChatSessionDB]:
-        """Get all sessions with pagination"""
+    async def get_all_sessions(limit: int = 100, offset: int = 0) -> List[Row]:
+        """Get all sessions with pagination (listing columns only, as Rows)"""
         async with get_async_session() as db_session:
             result = await db_session.execute(
-                select(ChatSessionDB)
+                select(*SESSION_LIST_COLUMNS)
                 .order_by(desc(ChatSessionDB.updated_at))
                 .limit(limit)
                 .offset(offset)
             )
-            return result.scalars().all()
+            return result.all()
         
     @staticmethod
     async def update_session(
@@ -85,29 +110,25 @@ class SessionManager:
     ) -> Optional[ChatSessionDB]:
         """Update session"""
         async with get_async_session() as db_session:
-            session = await SessionManager.get_session(session_id)
+            # Load in this db session (not via the cache) so the changes are tracked and committed
+            result = await db_session.execute(
+                select(ChatSessionDB).where(ChatSessionDB.session_id == session_id)
+            )
+            session = result.scalar_one_or_none()
             if not session:
                 return None
             
             if session_name:
                 session.session_name = session_name
             if metadata:
-                # Parse existing metadata
-                existing_metadata = {}
-                if session.session_info:
-                    try:
-                        existing_metadata = json.loads(session.session_info)
-                    except:
-                        pass
-                
-                # Merge and save
-                merged_metadata = {**existing_metadata, **metadata}
-                session.session_info = json.dumps(merged_metadata)  # ← Changed
+                # Merge into a new dict so the JSONB column is marked dirty
+                session.session_info = {**(session.session_info or {}), **metadata}
             
-            session.updated_at = datetime.utcnow()
+            session.updated_at = utcnow()
             await db_session.commit()
             await db_session.refresh(session)
-            return session
+        _session_cache.pop(session_id, None)
+        return session
     
     @staticmethod
     async def delete_session(session_id: str) -> bool:
@@ -123,18 +144,28 @@ class SessionManager:
                 delete(ChatSessionDB).where(ChatSessionDB.session_id == session_id)
             )
             await db_session.commit()
-            return result.rowcount > 0
+        _session_cache.pop(session_id, None)
+        return result.rowcount > 0
     
     @staticmethod
-    async def get_user_sessions(user_id: str) -> List[ChatSessionDB]:
-        """Get all sessions for a user"""
+    async def get_user_sessions(
+        user_id: str,
+        limit: Optional[int] = None,
+        offset: int = 0
+    ) -> List[Row]:
+        """Get all sessions for a user (optionally paginated; listing columns only, as Rows)"""
         async with get_async_session() as db_session:
-            result = await db_session.execute(
-                select(ChatSessionDB)
+            query = (
+                select(*SESSION_LIST_COLUMNS)
                 .where(ChatSessionDB.user_id == user_id)
                 .order_by(ChatSessionDB.updated_at.desc())
+                .offset(offset)
             )
-            return result.scalars().all()
+            if limit:
+                query = query.limit(limit)
+            
+            result = await db_session.execute(query)
+            return result.all()
     
     @staticmethod
     async def add_message(
@@ -149,8 +180,8 @@ class SessionManager:
                 session_id=session_id,
                 role=role,
                 content=content,
-                additional_data=json.dumps(metadata or {}),  # ← Changed: store as JSON string
-                timestamp=datetime.utcnow()
+                additional_data=metadata or {},
+                timestamp=utcnow()
             )
             db_session.add(message)
             
@@ -158,23 +189,58 @@ class SessionManager:
             await db_session.execute(
                 update(ChatSessionDB)
                 .where(ChatSessionDB.session_id == session_id)
-                .values(updated_at=datetime.utcnow())
+                .values(updated_at=utcnow())
             )
             
             await db_session.commit()
             await db_session.refresh(message)
             return message
     
+    @staticmethod
+    async def add_messages(session_id: str, rows: List[dict]) -> List[ChatMessageDB]:
+        """
+        Add several messages (dicts with role, content, metadata) in one transaction.
+        Raises LookupError if the session no longer exists.
+        """
+        now = utcnow()
+        async with get_async_session() as db_session:
+            # Bump the session timestamp first: it re-checks the session in the database,
+            # since get_session's cache may not have seen a delete made by another worker
+            result = await db_session.execute(
+                update(ChatSessionDB)
+                .where(ChatSessionDB.session_id == session_id)
+                .values(updated_at=now)
+            )
+            if result.rowcount == 0:
+                _session_cache.pop(session_id, None)
+                raise LookupError(f"Session not found: {session_id}")
+            
+            messages = [
+                ChatMessageDB(
+                    session_id=session_id,
+                    role=row["role"],
+                    content=row["content"],
+                    additional_data=row.get("metadata") or {},
+                    timestamp=now
+                )
+                for row in rows
+            ]
+            db_session.add_all(messages)
+            
+            await db_session.commit()
+            return messages
+    
     @staticmethod
     async def get_session_messages(
         session_id: str, 
-        limit: Optional[int] = None
+        limit: Optional[int] = None,
+        offset: int = 0
     ) -> List[ChatMessageDB]:
         """Get messages for a session"""
         async with get_async_session() as db_session:
             query = select(ChatMessageDB).where(
                 ChatMessageDB.session_id == session_id
-            ).order_by(ChatMessageDB.timestamp.asc())
+            ).order_by(ChatMessageDB.timestamp.asc(), ChatMessageDB.id.asc()).offset(offset)
             
             if limit:
                 query = query.limit(limit)
@@ -182,46 +248,49 @@ class SessionManager:
             result = await db_session.execute(query)
             return result.scalars().all()
     
+    @staticmethod
+    async def get_message_counts(session_ids: List[str]) -> Dict[str, int]:
+        """Message count per session in one grouped query (sessions without messages are absent)"""
+        if not session_ids:
+            return {}
+        async with get_async_session() as db_session:
+            result = await db_session.execute(
+                select(ChatMessageDB.session_id, func.count())
+                .where(ChatMessageDB.session_id.in_(session_ids))
+                .group_by(ChatMessageDB.session_id)
+            )
+            return dict(result.all())
+    
+    @staticmethod
+    async def get_message_count(session_id: str) -> int:
+        """Number of messages in a session"""
+        counts = await SessionManager.get_message_counts([session_id])
+        return counts.get(session_id, 0)
+    
     @staticmethod
     async def get_session_with_messages(session_id: str) -> Optional[ChatSession]:
-        """Get session with all messages - SIMPLE FIX"""
-        session = await SessionManager.get_session(session_id)
+        """Get session with all messages (messages eager-loaded in the same call)"""
+        async with get_async_session() as db_session:
+            result = await db_session.execute(
+                select(ChatSessionDB)
+                .options(selectinload(ChatSessionDB.messages))
+                .where(ChatSessionDB.session_id == session_id)
+            )
+            session = result.scalar_one_or_none()
         if not session:
             return None
+        messages = session.messages
         
-        # Get messages
-        messages = await SessionManager.get_session_messages(session_id)
-        
-        # Parse metadata safely
-        session_metadata = {}
-        if session.session_info:
-            try:
-                parsed = json.loads(session.session_info)
-                if isinstance(parsed, dict):
-                    session_metadata = parsed
-            except:
-                session_metadata = {}
-        
-        # Create messages with parsed metadata
-        message_list = []
-        for msg in messages:
-            msg_metadata = {}
-            if msg.additional_data:
-                try:
-                    parsed = json.loads(msg.additional_data)
-                    if isinstance(parsed, dict):
-                        msg_metadata = parsed
-                except:
-                    msg_metadata = {}
-            
-            message_list.append(
-                ChatMessage(
-                    role=msg.role,
-                    content=msg.content,
-                    timestamp=msg.timestamp,
-                    metadata=msg_metadata  # Already a dict
-                )
+        # JSONB columns come back as dicts already
+        message_list = [
+            ChatMessage(
+                role=msg.role,
+                content=msg.content,
+                timestamp=msg.timestamp,
+                metadata=msg.additional_data or {}
             )
+            for msg in messages
+        ]
         
         return ChatSession(
             session_id=session.session_id,
@@ -229,6 +298,6 @@ class SessionManager:
             session_name=session.session_name,
             created_at=session.created_at,
             updated_at=session.updated_at,
-            metadata=session_metadata,  # Already a dict
+            metadata=session.session_info or {},
             messages=message_list
         )
\ No newline at end of file
@@ -2,27 +2,23 @@ from __future__ import annotations
 from typing import List, Dict, Any
 from langchain.tools import tool
 
+from helper.retriver_engine import Chunks
 
-def build_context(chunks):
-    parts = []
-    for c in chunks:
-        md = c.get("metadata", {})
-        header = md.get("header", md.get("subheader", ""))
-        page = md.get("page", "")
-        parts.append(f"[page {page} | {header}]\n{c.get('text','')}")
-    return "\n\n---\n\n".join(parts)
 
+def build_context(chunks: Chunks) -> str:
+    return "\n\n---\n\n".join(
+        f"[page {page} | {header}]\n{text}"
+        for page, header, text in zip(chunks.pages, chunks.headers, chunks.texts)
+    )
 
 
-def chunks_to_sources(chunks):
+
+def chunks_to_sources(chunks: Chunks) -> List[Dict[str, Any]]:
     return [
-        {
-            "file_id": c["metadata"].get("file_id"),
-            "chunk_id": c["metadata"].get("chunk_id"),
-            "page": c["metadata"].get("page"),
-            "header": c["metadata"].get("header") or c["metadata"].get("subheader"),
-        }
-        for c in chunks
+        {"file_id": file_id, "chunk_id": chunk_id, "page": page, "header": header}
+        for file_id, chunk_id, page, header in zip(
+            chunks.file_ids, chunks.chunk_ids, chunks.pages, chunks.headers
+        )
     ]
 
 
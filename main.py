@@ -1,27 +1,48 @@
 # main.py
-from fastapi import FastAPI
+from fastapi import FastAPI, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, Response
 from contextlib import asynccontextmanager
+import logging
+import orjson
+import os
+import sys
 import uvicorn
 
 from routes.chat_route import router as chat_router
-from database.postgres import init_db
+from database.postgres import init_db_async, get_db, check_db_connection, dispose_engines
+from database.milvus import close_milvus
+from helper.llm import close_http_clients
+from helper.prep_citation import start_pandoc_server, stop_pandoc_server
+
+# DEBUG enables per-request context/LLM dumps; keep INFO in production
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO"),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup: Initialize database
     print("Initializing database...")
-    init_db()
+    await init_db_async()
     print("Database initialized!")
+    start_pandoc_server()  # no-op when `python main.py` already started it
     yield
     # Shutdown
     print("Shutting down...")
+    await dispose_engines()
+    close_milvus()
+    await close_http_clients()
+    stop_pandoc_server()
 
 app = FastAPI(
     title="RAG Chatbot API",
     description="RAG-based Chatbot with PostgreSQL Session Management",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,  # orjson for every route's JSON body
 )
 
 # CORS middleware
@@ -33,20 +54,57 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large JSON bodies (session detail, listings); text/event-stream is
+# excluded by Starlette, so /query/stream tokens are not buffered
+app.add_middleware(GZipMiddleware, minimum_size=int(os.getenv("GZIP_MIN_SIZE", "1000")))
+
 # Include routers
 app.include_router(chat_router)
 
+# Constant bodies, encoded once at import. A fresh Response wraps them per request:
+# middleware (CORS) mutates response headers in place, so instances aren't shared.
+_ROOT_BODY = orjson.dumps({
+    "message": "RAG Chatbot API",
+    "version": "1.0.0",
+    "docs": "/docs"
+})
+_HEALTH_BODY = orjson.dumps({"status": "healthy"})
+
 @app.get("/")
 async def root():
-    return {
-        "message": "RAG Chatbot API",
-        "version": "1.0.0",
-        "docs": "/docs"
-    }
+    return Response(content=_ROOT_BODY, media_type="application/json")
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return Response(content=_HEALTH_BODY, media_type="application/json")
+
+@app.get("/healthz")
+async def healthz(db=Depends(get_db)):
+    """Readiness probe: checks a pooled database connection"""
+    try:
+        await check_db_connection(db)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Database unavailable: {e}")
+    return {"status": "healthy", "database": "ok"}
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    # uvloop (not available on Windows) + httptools. RELOAD=1 runs a single
+    # auto-reloading dev process; otherwise WEB_CONCURRENCY workers. Each worker
+    # loads its own models and keeps its own session memory and query cache.
+    reload = os.getenv("RELOAD", "0") == "1"
+    # One pandoc server for all workers: they would all bind the same port. Started
+    # here, before they are spawned; the env flag stops their lifespans from retrying
+    start_pandoc_server()
+    os.environ["PANDOC_SERVER_AUTOSTART"] = "0"
+    try:
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=8000,
+            reload=reload,
+            workers=1 if reload else int(os.getenv("WEB_CONCURRENCY", "1")),
+            loop="asyncio" if sys.platform == "win32" else "uvloop",
+            http="httptools",
+        )
+    finally:
+        stop_pandoc_server()
\ No newline at end of file
@@ -1,19 +1,102 @@
 # routes/chat.py
 from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from typing import List, Optional
 import uuid
-from datetime import datetime
-import json 
+import orjson
 
-from schemas.chat_models import QueryRequest, QueryResponse, ChatSession
+from schemas.chat_models import QueryRequest, QueryResponse, ChatSession, utcnow
 from helper.session_manager import SessionManager
 from helper.core import RagOrchestrator
+from helper.query_cache import QueryCache
 from utils.time_formatter import get_time_ago
 
 router = APIRouter(prefix="/api/v1/chat", tags=["RAG Chat API"])
 
 # Initialize RAG orchestrator
 rag_orchestrator = RagOrchestrator()
+# Per-session exact/near-duplicate query cache (embeddings reuse the retriever's LRU)
+query_cache = QueryCache(embed_fn=rag_orchestrator.retriever.aembed_query)
+
+async def _resolve_session(request: QueryRequest) -> Optional[str]:
+    """Load the request's session (404 if unknown) or create one; returns the session name"""
+    if request.session_id:
+        session = await SessionManager.get_session(request.session_id)
+        if not session:
+            raise HTTPException(status_code=404, detail="Session not found")
+        return session.session_name
+    
+    # Create new session
+    session_name = await SessionManager.generate_session_name(request.query)
+    session = await SessionManager.create_session(
+        user_id=request.user_id,
+        session_name=session_name
+    )
+    request.session_id = session.session_id
+    return session_name
+
+async def _save_turns(session_id: str, query: str, result: dict):
+    """Save both turns to database in one transaction"""
+    await SessionManager.add_messages(session_id, [
+        {"role": "user", "content": query},
+        {
+            "role": "assistant",
+            "content": result["answer"],
+            "metadata": {
+                "citation_required": result["citation_required"],
+                "citation_limit": result["citation_limit"],
+                "files_used": result["files_used"],
+                "citations": result["citations"],
+                "memory_used": result["memory_used"],
+            },
+        },
+    ])
+
+async def _cache_answer(request: QueryRequest, result: dict):
+    """Keep a successful answer for repeats, unless it leaned on session memory"""
+    # A memory-based answer depends on the conversation so far, which the next turn changes
+    if result.get("status") == "success" and not result.get("memory_used"):
+        await query_cache.set(request.session_id, request.query, result)
+
+def _query_response(request: QueryRequest, session_name: Optional[str], result: dict) -> QueryResponse:
+    return QueryResponse(
+        status=result["status"],
+        query=result["query"],
+        answer=result["answer"],
+        citation_required=result["citation_required"],
+        citation_limit=result["citation_limit"],
+        files_used=result["files_used"],
+        citations=result["citations"],
+        chunks_retrieved=result["chunks_retrieved"],
+        session_id=request.session_id,
+        session_name=session_name,
+        memory_used=result["memory_used"],
+        timestamp=utcnow()
+    )
+
+async def _session_list(sessions) -> List[dict]:
+    """Listing payload for rows of SessionManager.SESSION_LIST_COLUMNS"""
+    # One grouped count query instead of loading every session's messages
+    counts = await SessionManager.get_message_counts([s.session_id for s in sessions])
+    
+    result = []
+    now = utcnow()
+    # Rows unpacked positionally
+    for session_id, session_name, session_user_id, created_at, updated_at in sessions:
+        result.append({
+            "session_id": session_id,
+            "session_name": session_name,
+            "user_id": session_user_id,
+            "created_at": created_at,
+            "updated_at": updated_at,
+            "message_count": counts.get(session_id, 0),
+            "last_chat_time_ago": get_time_ago(updated_at, now)
+        })
+    return result
+
+def _sse(event: str, data: dict) -> bytes:
+    """One Server-Sent Events frame"""
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
 
 @router.post("/query", response_model=QueryResponse)
 async def process_query(request: QueryRequest):
@@ -21,78 +104,97 @@ async def process_query(request: QueryRequest):
     Simple query processing with memory
     """
     try:
-        # Get or create session
-        if request.session_id:
-            session = await SessionManager.get_session(request.session_id)
-            if not session:
-                raise HTTPException(status_code=404, detail="Session not found")
-            session_name = session.session_name
-        else:
-            # Create new session
-            session_name = await SessionManager.generate_session_name(request.query)
-            session = await SessionManager.create_session(
-                user_id=request.user_id,
-                session_name=session_name
+        session_name = await _resolve_session(request)
+        
+        # Process query (repeat questions in the session skip the whole pipeline)
+        result = await query_cache.get(request.session_id, request.query)
+        if result is None:
+            result = await rag_orchestrator.process_query(
+                query=request.query,
+                session_id=request.session_id,
+                user_id=request.user_id
             )
-            request.session_id = session.session_id
+            await _cache_answer(request, result)
+        else:
+            result = {**result, "query": request.query}
+            await rag_orchestrator.record_turn(request.session_id, request.query, result)
         
-        # Process query
-        result = await rag_orchestrator.process_query(
-            query=request.query,
-            session_id=request.session_id,
-            user_id=request.user_id
-        )
+        await _save_turns(request.session_id, request.query, result)
         
-        # Save to database
-        await SessionManager.add_message(
-            session_id=request.session_id,
-            role="user",
-            content=request.query
-        )
-        
-        await SessionManager.add_message(
-            session_id=request.session_id,
-            role="assistant",
-            content=result["answer"],
-            metadata={
-                "citation_required": result["citation_required"],
-                "citation_limit": result["citation_limit"],
-                "files_used": result["files_used"],
-                "citations": result["citations"],
-                "memory_used": result["memory_used"],
-            }
-        )
-        
-        return QueryResponse(
-            status=result["status"],
-            query=result["query"],
-            answer=result["answer"],
-            citation_required=result["citation_required"],
-            citation_limit=result["citation_limit"],
-            files_used=result["files_used"],
-            citations=result["citations"],
-            chunks_retrieved=result["chunks_retrieved"],
-            session_id=request.session_id,
-            session_name=session_name,
-            memory_used=result["memory_used"],
-            timestamp=datetime.utcnow()
-        )
+        response = _query_response(request, session_name, result)
+        # Already a validated QueryResponse; skip FastAPI's response_model pass
+        return ORJSONResponse(content=response.model_dump(mode="json"))
         
+    except LookupError as e:
+        # Session deleted (possibly by another worker) while the answer was generated
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         print(f"Error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/query/stream")
+async def process_query_stream(request: QueryRequest):
+    """
+    Same as /query, streamed as Server-Sent Events:
+    "token" events carry answer text as it is generated, then a "done" event
+    carries the full QueryResponse (or an "error" event with the detail).
+    """
+    try:
+        session_name = await _resolve_session(request)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    async def events():
+        try:
+            result = await query_cache.get(request.session_id, request.query)
+            if result is None:
+                async for event in rag_orchestrator.process_query_stream(
+                    query=request.query,
+                    session_id=request.session_id,
+                    user_id=request.user_id
+                ):
+                    if event["type"] == "token":
+                        yield _sse("token", {"text": event["text"]})
+                    else:
+                        result = event["result"]
+                await _cache_answer(request, result)
+            else:
+                result = {**result, "query": request.query}
+                await rag_orchestrator.record_turn(request.session_id, request.query, result)
+                yield _sse("token", {"text": result["answer"]})
+            
+            # Persisted only once the answer is complete
+            await _save_turns(request.session_id, request.query, result)
+            response = _query_response(request, session_name, result)
+            yield _sse("done", response.model_dump(mode="json"))
+        except Exception as e:
+            print(f"Error: {str(e)}")
+            yield _sse("error", {"detail": str(e)})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @router.post("/memory/{session_id}/clear")
 async def clear_memory(session_id: str):
     """Clear memory for session"""
     try:
-        from helper.memory import SimpleMemoryManager
-        memory_manager = SimpleMemoryManager()
-        await memory_manager.clear_session_memory(session_id)
+        # The orchestrator's manager holds the memories; a fresh instance would be empty
+        await rag_orchestrator.memory_manager.clear_session_memory(session_id)
+        await query_cache.invalidate_session(session_id)
         return {"message": "Memory cleared", "session_id": session_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/cache/stats")
+async def cache_stats():
+    """Semantic and embedding cache hit/miss counters for this process"""
+    return rag_orchestrator.get_cache_stats()
+
 @router.post("/sessions", response_model=dict)
 async def create_session(
     user_id: Optional[str] = None,
@@ -126,23 +228,7 @@ async def get_all_sessions(
     """Get all sessions (paginated)"""
     try:
         sessions = await SessionManager.get_all_sessions(limit=limit, offset=offset)
-        
-        result = []
-        for session in sessions:
-            # Get message count for each session
-            messages = await SessionManager.get_session_messages(session.session_id)
-            
-            result.append({
-                "session_id": session.session_id,
-                "session_name": session.session_name,
-                "user_id": session.user_id,
-                "created_at": session.created_at,
-                "updated_at": session.updated_at,
-                "message_count": len(messages),
-                "last_chat_time_ago": get_time_ago(session.updated_at)
-            })
-        
-        return result
+        return await _session_list(sessions)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -156,22 +242,7 @@ async def get_user_sessions(
     """Get all sessions for a user"""
     try:
         sessions = await SessionManager.get_user_sessions(user_id, limit=limit, offset=offset)
-        
-        result = []
-        for session in sessions:
-            messages = await SessionManager.get_session_messages(session.session_id)
-            
-            result.append({
-                "session_id": session.session_id,
-                "session_name": session.session_name,
-                "user_id": session.user_id,
-                "created_at": session.created_at,
-                "updated_at": session.updated_at,
-                "message_count": len(messages),
-                "last_chat_time_ago": get_time_ago(session.updated_at)
-            })
-        
-        return result
+        return await _session_list(sessions)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -184,7 +255,7 @@ async def get_session_details(session_id: str):
         if not session:
             raise HTTPException(status_code=404, detail="Session not found")
         
-        messages = await SessionManager.get_session_messages(session_id)
+        message_count = await SessionManager.get_message_count(session_id)
         
         return {
             "session_id": session.session_id,
@@ -192,7 +263,7 @@ async def get_session_details(session_id: str):
             "user_id": session.user_id,
             "created_at": session.created_at,
             "updated_at": session.updated_at,
-            "message_count": len(messages),
+            "message_count": message_count,
             "last_chat_time_ago": get_time_ago(session.updated_at)
         }
         
@@ -209,21 +280,31 @@ async def get_session_with_messages(session_id: str):
         if not session:
             raise HTTPException(status_code=404, detail="Session not found")
         
-        return session
+        # Already a validated ChatSession; skip FastAPI's response_model pass
+        return ORJSONResponse(content=session.model_dump(mode="json"))
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/sessions/{session_id}")
-async def delete_session(session_id: str):
+async def delete_session(
+    session_id: str,
+    return_list: bool = Query(False, description="Include the updated session list (as /sessions/all)"),
+    limit: int = Query(100, description="Number of sessions in the returned list", ge=1, le=1000)
+):
     """Delete a session and all its messages"""
     try:
         success = await SessionManager.delete_session(session_id)
         if not success:
             raise HTTPException(status_code=404, detail="Session not found")
         
-        return {"message": "Session deleted successfully", "session_id": session_id}
+        result = {"message": "Session deleted successfully", "session_id": session_id}
+        if return_list:
+            # Saves clients the follow-up GET /sessions/all
+            sessions = await SessionManager.get_all_sessions(limit=limit)
+            result["sessions"] = await _session_list(sessions)
+        return result
     except HTTPException:
         raise
     except Exception as e:
@@ -245,13 +326,13 @@ async def update_session(
         if not session:
             raise HTTPException(status_code=404, detail="Session not found")
         
-        messages = await SessionManager.get_session_messages(session_id)
+        message_count = await SessionManager.get_message_count(session_id)
         
         return {
             "session_id": session.session_id,
             "session_name": session.session_name,
             "updated_at": session.updated_at,
-            "message_count": len(messages),
+            "message_count": message_count,
             "last_chat_time_ago": get_time_ago(session.updated_at)
         }
     except HTTPException:
@@ -274,25 +355,28 @@ async def get_session_messages(
         messages = await SessionManager.get_session_messages(session_id, limit=limit, offset=offset)
         
         result = []
+        now = utcnow()
         for msg in messages:
-            metadata = json.loads(msg.additional_data) if msg.additional_data else {}
             result.append({
                 "message_id": msg.message_id,
                 "role": msg.role,
                 "content": msg.content,
                 "timestamp": msg.timestamp,
-                "time_ago": get_time_ago(msg.timestamp),
-                "metadata": metadata
+                "time_ago": get_time_ago(msg.timestamp, now),
+                "metadata": msg.additional_data or {}
             })
         
-        return {
+        # Returned as-is: orjson handles the datetimes, no jsonable_encoder pass
+        return ORJSONResponse({
             "session_id": session_id,
             "session_name": session.session_name,
-            "total_messages": len(await SessionManager.get_session_messages(session_id)),
+            "total_messages": await SessionManager.get_message_count(session_id),
             "messages": result,
             "limit": limit,
             "offset": offset
-        }
+        })
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
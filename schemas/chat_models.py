@@ -1,44 +1,72 @@
 # schemas/chat_models.py
-from datetime import datetime
-from typing import List, Optional, Dict, Any
-from pydantic import BaseModel, Field, field_validator
-from sqlalchemy import Column, String, DateTime, Integer, Text
+from datetime import datetime, timezone
+from typing import List, Literal, Optional, Dict, Any
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+from sqlalchemy import Column, String, DateTime, Index, Integer, Text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 import uuid
 
 # Create declarative base
 Base = declarative_base()
 
+def utcnow() -> datetime:
+    """Timezone-aware current UTC time (replaces the deprecated, naive datetime.utcnow)"""
+    return datetime.now(timezone.utc)
+
 class ChatSessionDB(Base):
     __tablename__ = "chat_sessions"
+    # Per-user listing (WHERE user_id ORDER BY updated_at DESC) reads the index in order;
+    # also covers plain user_id lookups
+    __table_args__ = (
+        Index("ix_chat_sessions_user_updated", "user_id", "updated_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(String, unique=True, index=True, nullable=False)
-    user_id = Column(String, index=True, nullable=True)
+    user_id = Column(String, nullable=True)
     session_name = Column(String, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime(timezone=True), default=utcnow)
+    updated_at = Column(DateTime(timezone=True), default=utcnow, onupdate=utcnow)
     
     # SIMPLEST: Don't use 'metadata' at all in SQLAlchemy model
-    # Store metadata in a different column
-    session_info = Column(Text, default='{}')  # Store JSON as text
+    # Store metadata in a different column (native JSONB; the driver (de)serializes)
+    session_info = Column(JSONB, default=dict)
+    
+    # No FK between the tables, so the join is spelled out; read-only (writes go through
+    # SessionManager.add_message), eager-loaded with selectinload
+    messages = relationship(
+        "ChatMessageDB",
+        primaryjoin="ChatSessionDB.session_id == foreign(ChatMessageDB.session_id)",
+        order_by="[ChatMessageDB.timestamp, ChatMessageDB.id]",
+        viewonly=True,
+        lazy="raise",
+    )
 
 class ChatMessageDB(Base):
     __tablename__ = "chat_messages"
+    # Matches get_session_messages (WHERE session_id ORDER BY timestamp, id): no sort step;
+    # also covers session_id-only lookups, counts and deletes
+    __table_args__ = (
+        Index("ix_chat_messages_session_ts", "session_id", "timestamp", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
-    session_id = Column(String, index=True, nullable=False)
+    session_id = Column(String, nullable=False)
     message_id = Column(String, default=lambda: str(uuid.uuid4()))
     role = Column(String, nullable=False)  # 'user' or 'assistant'
     content = Column(Text, nullable=False)
     
-    # Store metadata as JSON text
-    additional_data = Column(Text, default='{}')
+    # Store metadata as JSONB
+    additional_data = Column(JSONB, default=dict)
     
-    timestamp = Column(DateTime, default=datetime.utcnow)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime(timezone=True), default=utcnow)
+    created_at = Column(DateTime(timezone=True), default=utcnow)
 # Pydantic Schemas
 class ChatMessage(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    
     role: str
     content: str
     timestamp: Optional[datetime] = None
@@ -47,20 +75,23 @@ class ChatMessage(BaseModel):
     @field_validator('metadata', mode='before')
     @classmethod
     def convert_metadata(cls, v):
-        if v is None:
-            return {}
+        # JSONB columns already come back as dicts; everything else is the rare path
         if isinstance(v, dict):
             return v
+        if v is None:
+            return {}
         # If it's a MetaData or similar object
         if hasattr(v, '__dict__'):
             return v.__dict__
         # Try to convert to dict
         try:
             return dict(v)
-        except:
+        except (TypeError, ValueError):
             return {}
 
 class ChatSession(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    
     session_id: str
     user_id: Optional[str] = None
     session_name: str
@@ -68,9 +99,21 @@ class ChatSession(BaseModel):
     updated_at: Optional[datetime] = None
     messages: List[ChatMessage] = []
     metadata: Optional[dict] = None
-    
-    class Config:
-        from_attributes = True
+
+class LLMResponse(BaseModel):
+    """JSON payload returned by the LLM, validated in one pass"""
+    answer: str = "No answer generated"
+    citation_required: Literal["yes", "no"] = "no"
+    citation_limit: int = 0
+    files_used: int = 0
+
+    @field_validator('citation_required', mode='before')
+    @classmethod
+    def normalize_citation_required(cls, v):
+        # LLMs occasionally return "Yes" or a bare boolean
+        if isinstance(v, bool):
+            return "yes" if v else "no"
+        return "yes" if str(v).strip().lower() == "yes" else "no"
 
 class QueryRequest(BaseModel):
     query: str
@@ -78,6 +121,8 @@ class QueryRequest(BaseModel):
     user_id: Optional[str] = None
 
 class QueryResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    
     status: str
     query: str
     answer: str
@@ -90,4 +135,4 @@ class QueryResponse(BaseModel):
     session_name: Optional[str] = None
     session_metadata: Optional[dict] = None
     memory_used: bool = False
-    timestamp: datetime = Field(default_factory=datetime.utcnow)
\ No newline at end of file
+    timestamp: datetime = Field(default_factory=utcnow)
\ No newline at end of file
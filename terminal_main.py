@@ -1,9 +1,42 @@
 # main.py
 import asyncio
+import sys
+import threading
 from helper.core import RagOrchestrator
 from helper.prep_citation import create_section_html_from_chunk  # optional, already default
 
 
+# ---- CLI commands (return True to quit) ----
+def _quit(session_id, user_id):
+    print("👋 Thanks for using RAG CLI!")
+    return True
+
+def _clear(session_id, user_id):
+    print("🧹 Session cleared!")
+
+def _status(session_id, user_id):
+    print(f"📊 Session: {session_id} | User: {user_id}")
+    print("✅ Ready for queries!")
+
+_CMDS = {"exit": _quit, "/clear": _clear, "/status": _status}
+
+
+def _start_stdin_reader() -> asyncio.Queue:
+    """Feed stdin lines into a queue from a daemon thread (None at EOF)"""
+    # Daemon, so a blocked read never holds up exit; waiting on the queue stays
+    # cancellable, so Ctrl+C reaches the event loop
+    loop = asyncio.get_running_loop()
+    lines = asyncio.Queue()
+    
+    def read():
+        for line in sys.stdin:
+            loop.call_soon_threadsafe(lines.put_nowait, line)
+        loop.call_soon_threadsafe(lines.put_nowait, None)
+    
+    threading.Thread(target=read, name="stdin-reader", daemon=True).start()
+    return lines
+
+
 async def main():
     orch = RagOrchestrator(
         # agar env me GROQ_API_KEY set hai to api_key pass karna optional hai
@@ -16,20 +49,16 @@ async def main():
     print("🤖 RAG CLI (type 'exit' or empty line to quit)")
     print("💡 Tip: Use /clear to reset session | /status for debug info")
     
+    lines = _start_stdin_reader()
     while True:
         try:
-            query = input("\n👤 User: ").strip()
-            if not query or query.lower() == 'exit':
-                print("👋 Thanks for using RAG CLI!")
-                break
-
-            if query.lower() == '/clear':
-                print("🧹 Session cleared!")
-                continue
-                
-            if query.lower() == '/status':
-                print(f"📊 Session: {session_id} | User: {user_id}")
-                print("✅ Ready for queries!")
+            print("\n👤 User: ", end="", flush=True)
+            line = await lines.get()
+            query = line.strip() if line is not None else ""
+            handler = _CMDS.get(query.lower()) if query else _quit
+            if handler:
+                if handler(session_id, user_id):
+                    break
                 continue
 
             print("🤔 Processing...")
@@ -64,7 +93,8 @@ async def main():
             print(f"Intent: {resp.get('intent', 'auto')}")
             print(f"Response time: ~{resp.get('processing_time', 'N/A')}s")
             
-        except KeyboardInterrupt:
+        except (KeyboardInterrupt, asyncio.CancelledError):
+            # asyncio.run turns Ctrl+C into a cancellation of this task
             print("\n\n⏹️  Interrupted by user. Goodbye!")
             break
         except Exception as e:
@@ -0,0 +1,51 @@
+import json
+import re
+
+import pytest
+
+pytest.importorskip("langchain_text_splitters")
+
+from utils.dynamic_chunker import DynamicMarkdownChunker, _PAGE_RE
+
+
+def _write_document(folder, sections=40):
+    """Marker-style document: sections with blank-line paragraphs and a page break every third section"""
+    parts = []
+    page = 0
+    for i in range(sections):
+        parts.append(f"## Section {i}\n\nFirst line of section {i} body text here.\n")
+        for k in range(8):
+            parts.append(f"\nPara {k} of {i}.\n")
+        if i % 3 == 2:
+            page += 1
+            parts.append(f"{{{page}}}------------------------------------------------\n")
+        parts.append(f"Trailing paragraph for section {i}, a few more words.\n\n")
+    md_content = "".join(parts)
+
+    folder.mkdir()
+    (folder / "doc.md").write_text(md_content, encoding="utf-8")
+    (folder / "blocks.json").write_text(json.dumps({}), encoding="utf-8")
+    (folder / "doc_meta.json").write_text(json.dumps({}), encoding="utf-8")
+    return md_content
+
+
+def _expected_pages(md_content):
+    """Page range of each section from its true span in the source"""
+    starts = [m.start() for m in re.finditer(r"^## ", md_content, re.M)] + [len(md_content)]
+    expected = []
+    for start, end in zip(starts, starts[1:]):
+        before = _PAGE_RE.findall(md_content[:start])
+        inside = _PAGE_RE.findall(md_content[start:end])
+        start_page = int(before[-1]) if before else 0
+        end_page = int(inside[-1]) if inside else start_page
+        expected.append(str(start_page) if start_page == end_page else f"{start_page}-{end_page}")
+    return expected
+
+
+def test_page_ranges_across_many_sections(tmp_path):
+    folder = tmp_path / "doc"
+    md_content = _write_document(folder)
+
+    chunks, _ = DynamicMarkdownChunker(str(tmp_path)).chunk_folder(folder)
+
+    assert [meta.page for _, meta in chunks] == _expected_pages(md_content)
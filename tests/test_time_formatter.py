@@ -0,0 +1,34 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from utils.time_formatter import get_time_ago
+
+NOW = datetime(2026, 10, 15, 12, 0, 30, tzinfo=timezone.utc)
+
+
+@pytest.mark.parametrize(
+    "elapsed, expected",
+    [
+        (timedelta(seconds=0), "just now"),
+        (timedelta(seconds=31), "just now"),
+        (timedelta(seconds=59), "just now"),
+        (timedelta(seconds=60), "1 minute ago"),
+        (timedelta(seconds=119), "1 minute ago"),
+        (timedelta(seconds=120), "2 minutes ago"),
+        (timedelta(hours=1), "1 hour ago"),
+        (timedelta(days=1, hours=3), "yesterday"),
+        (timedelta(days=400), "1 year ago"),
+        (timedelta(seconds=-30), "just now"),
+    ],
+)
+def test_time_ago_boundaries(elapsed, expected):
+    assert get_time_ago(NOW - elapsed, now=NOW) == expected
+
+
+def test_naive_timestamps_are_utc():
+    assert get_time_ago((NOW - timedelta(minutes=5)).replace(tzinfo=None), now=NOW) == "5 minutes ago"
+
+
+def test_none_is_never():
+    assert get_time_ago(None) == "never"
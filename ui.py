@@ -1,19 +1,31 @@
 import streamlit as st
-import requests
-from datetime import datetime, timedelta
+import httpx
+from datetime import date, datetime, timedelta
 from pathlib import Path
-import time
+from concurrent.futures import ThreadPoolExecutor
+from bisect import bisect_left
+import orjson
 import os
+import re
 
 # Configuration
 API_BASE_URL = "http://localhost:8000"
+# Paths relative to API_BASE_URL (the shared client carries the base URL)
 API_ENDPOINTS = {
-    "query": f"{API_BASE_URL}/api/v1/chat/query",
-    "sessions": f"{API_BASE_URL}/api/v1/chat/sessions",
-    "session_detail": f"{API_BASE_URL}/api/v1/chat/sessions/{{session_id}}/full",
-    "delete_session": f"{API_BASE_URL}/api/v1/chat/sessions/{{session_id}}",
-    "clear_memory": f"{API_BASE_URL}/api/v1/chat/memory/{{session_id}}/clear",
+    "query": "/api/v1/chat/query",
+    "query_stream": "/api/v1/chat/query/stream",
+    "sessions": "/api/v1/chat/sessions",
+    "session_detail": "/api/v1/chat/sessions/{session_id}/full",
+    "delete_session": "/api/v1/chat/sessions/{session_id}",
+    "clear_memory": "/api/v1/chat/memory/{session_id}/clear",
 }
+# Fail fast when the backend is down; reads allow for a full RAG answer
+API_CONNECT_TIMEOUT = float(os.getenv("UI_API_CONNECT_TIMEOUT", "5"))
+API_READ_TIMEOUT = float(os.getenv("UI_API_READ_TIMEOUT", "120"))
+# Reruns within this window reuse the fetched session list
+SESSIONS_CACHE_TTL = int(os.getenv("UI_SESSIONS_CACHE_TTL", "30"))
+# Session details are keyed on updated_at, so they can be kept much longer
+SESSION_DETAIL_CACHE_TTL = int(os.getenv("UI_SESSION_DETAIL_CACHE_TTL", "300"))
 
 # Page config
 st.set_page_config(
@@ -24,7 +36,7 @@ st.set_page_config(
 )
 
 # Custom CSS
-st.markdown("""
+_CSS = """
 <style>
     /* Delete button styling */
     button[kind="secondary"] {
@@ -127,7 +139,28 @@ st.markdown("""
         color: #64748b;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
+@st.cache_resource
+def minified_css(css: str) -> str:
+    """css without comments and indentation (most of its size); computed once per process"""
+    return re.sub(r"\s*([{}:;,])\s*", r"\1", re.sub(r"/\*.*?\*/|\s+", " ", css, flags=re.DOTALL)).strip()
+
+# Streamlit drops elements a rerun doesn't emit, so the style block is sent on every run
+st.markdown(minified_css(_CSS), unsafe_allow_html=True)
+
+@st.cache_resource
+def api_client() -> httpx.Client:
+    """Keep-alive HTTP client shared by every API helper (one per Streamlit process)"""
+    return httpx.Client(
+        base_url=API_BASE_URL,
+        timeout=httpx.Timeout(API_READ_TIMEOUT, connect=API_CONNECT_TIMEOUT),
+        limits=httpx.Limits(max_keepalive_connections=10),
+    )
+
+@st.cache_resource
+def background_executor() -> ThreadPoolExecutor:
+    """Worker threads for API calls that shouldn't block the script run"""
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="ui-bg")
 
 # Initialize session state
 def init_session_state():
@@ -141,6 +174,8 @@ def init_session_state():
         st.session_state.user_id = "streamlit_user"
     if "sessions_list" not in st.session_state:
         st.session_state.sessions_list = []
+    if "sessions_future" not in st.session_state:
+        st.session_state.sessions_future = None
     if "conversations" not in st.session_state:
         st.session_state.conversations = {}
 
@@ -151,14 +186,35 @@ def create_new_session():
     st.session_state.current_session_id = None
     st.session_state.current_session_name = "New Chat"
 
+def _request_session(session_id: str):
+    """GET a session with its messages; None if the API doesn't return it"""
+    response = api_client().get(
+        API_ENDPOINTS["session_detail"].format(session_id=session_id)
+    )
+    if response.status_code == 200:
+        return orjson.loads(response.content)
+    return None
+
+@st.cache_data(ttl=SESSION_DETAIL_CACHE_TTL, show_spinner=False, max_entries=64)
+def _fetch_session(session_id: str, updated_at: str):
+    """Cached _request_session; updated_at is part of the key, so a changed session is refetched"""
+    return _request_session(session_id)
+
 def load_session(session_id: str):
     """Load an existing session"""
     try:
-        response = requests.get(
-            API_ENDPOINTS["session_detail"].format(session_id=session_id)
+        # Re-opening a session that hasn't changed since it was listed skips the request
+        listed = next(
+            (s for s in st.session_state.sessions_list if s.get("session_id") == session_id),
+            None
         )
-        if response.status_code == 200:
-            session_data = response.json()
+        updated_at = listed.get("updated_at") if listed else None
+        if updated_at:
+            session_data = _fetch_session(session_id, updated_at)
+        else:
+            session_data = _request_session(session_id)
+        
+        if session_data:
             st.session_state.current_session_id = session_data["session_id"]
             st.session_state.current_session_name = session_data["session_name"]
             
@@ -178,24 +234,67 @@ def load_session(session_id: str):
         st.error(f"Error loading session: {str(e)}")
         return False
 
-def get_all_sessions():
-    """Fetch all sessions from API"""
+def _with_display_names(sessions):
+    """Add the truncated sidebar label once per fetch instead of on every rerun"""
+    for session in sessions:
+        session["display_name"] = session.get("session_name", "Unnamed Session")[:35]
+    return sessions
+
+def _request_sessions():
+    """GET the session list; no Streamlit calls, so it is safe on a worker thread"""
+    response = api_client().get(f"{API_ENDPOINTS['sessions']}/all", params={"limit": 50})
+    response.raise_for_status()
+    return _with_display_names(orjson.loads(response.content))
+
+@st.cache_data(ttl=SESSIONS_CACHE_TTL, show_spinner=False)
+def _fetch_sessions():
+    """Cached session list; errors raise so failures are never cached"""
+    return _request_sessions()
+
+def get_all_sessions(refresh: bool = False):
+    """Fetch all sessions from API (cached for SESSIONS_CACHE_TTL; refresh=True after changes)"""
+    if refresh:
+        _fetch_sessions.clear()
     try:
-        response = requests.get(f"{API_ENDPOINTS['sessions']}/all?limit=50")
-        if response.status_code == 200:
-            return response.json()
-        return []
+        return _fetch_sessions()
     except Exception as e:
         st.error(f"Error fetching sessions: {str(e)}")
         return []
 
+def refresh_sessions_in_background():
+    """Start a session list refresh; collect_sessions_refresh picks it up on the next run"""
+    _fetch_sessions.clear()
+    st.session_state.sessions_future = background_executor().submit(_request_sessions)
+
+def collect_sessions_refresh():
+    """Apply a finished background refresh; until then the current list stays on screen"""
+    future = st.session_state.sessions_future
+    if future is None or not future.done():
+        return  # Never block the rerun on the HTTP call; a later run picks it up
+    st.session_state.sessions_future = None
+    try:
+        st.session_state.sessions_list = future.result()
+    except Exception as e:
+        st.error(f"Error fetching sessions: {str(e)}")
+
 def delete_session(session_id: str):
-    """Delete a session"""
+    """Delete a session; on success st.session_state.sessions_list is updated too"""
     try:
-        response = requests.delete(
-            API_ENDPOINTS["delete_session"].format(session_id=session_id)
+        # return_list: the response carries the updated list, so no follow-up GET
+        response = api_client().delete(
+            API_ENDPOINTS["delete_session"].format(session_id=session_id),
+            params={"return_list": 1, "limit": 50}
         )
-        return response.status_code == 200
+        if response.status_code != 200:
+            return False
+        
+        _fetch_sessions.clear()
+        sessions = orjson.loads(response.content).get("sessions")
+        if sessions is None:
+            # Backend without return_list support
+            sessions = get_all_sessions()
+        st.session_state.sessions_list = _with_display_names(sessions)
+        return True
     except Exception as e:
         st.error(f"Error deleting session: {str(e)}")
         return False
@@ -203,7 +302,7 @@ def delete_session(session_id: str):
 def clear_session_memory(session_id: str):
     """Clear memory for a session"""
     try:
-        response = requests.post(
+        response = api_client().post(
             API_ENDPOINTS["clear_memory"].format(session_id=session_id)
         )
         return response.status_code == 200
@@ -211,8 +310,8 @@ def clear_session_memory(session_id: str):
         st.error(f"Error clearing memory: {str(e)}")
         return False
 
-def send_message(message: str):
-    """Send message to API and get response"""
+def send_message(message: str, on_token=None):
+    """Send message to API and get response; answer text is passed to on_token as it streams in"""
     try:
         payload = {
             "query": message,
@@ -220,46 +319,88 @@ def send_message(message: str):
             "user_id": st.session_state.user_id
         }
         
-        response = requests.post(API_ENDPOINTS["query"], json=payload)
+        # Server-Sent Events: "token" events, then "done" (full response) or "error"
+        with api_client().stream(
+            "POST",
+            API_ENDPOINTS["query_stream"],
+            content=orjson.dumps(payload),
+            headers={"Content-Type": "application/json"},
+        ) as response:
+            if response.status_code != 200:
+                st.error(f"API Error: {response.status_code}")
+                return None
+            
+            event = None
+            for line in response.iter_lines():
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                elif line.startswith("data: "):
+                    data = orjson.loads(line[len("data: "):])
+                    if event == "token":
+                        if on_token:
+                            on_token(data["text"])
+                    elif event == "done":
+                        return data
+                    elif event == "error":
+                        st.error(f"API Error: {data.get('detail')}")
+                        return None
         
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.error(f"API Error: {response.status_code}")
-            return None
+        st.error("API Error: stream ended without a response")
+        return None
     except Exception as e:
         st.error(f"Error sending message: {str(e)}")
         return None
 
+def _parse_last_chat(last_chat_str):
+    """Naive datetime for an API timestamp; None if missing or unparseable"""
+    try:
+        return datetime.fromisoformat(last_chat_str.replace('Z', '+00:00')).replace(tzinfo=None)
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _session_categories(last_chats: tuple, today: date) -> tuple:
+    """Category name per last-chat timestamp (cached; today is part of the key)"""
+    today_start = datetime.combine(today, datetime.min.time())
+    week_start = today_start - timedelta(days=today.weekday())
+    
+    def is_before(i, boundary):
+        # Missing/unparseable timestamps sort last and count as Older
+        last_chat = _parse_last_chat(last_chats[i])
+        return last_chat is None or last_chat < boundary
+    
+    n = len(last_chats)
+    # The API lists sessions newest first (uniform ISO strings compare like the datetimes),
+    # so each bucket is a contiguous run and two binary searches parse O(log n) timestamps
+    if all(a >= b for a, b in zip(last_chats, last_chats[1:])):
+        today_end = bisect_left(range(n), True, key=lambda i: is_before(i, today_start))
+        week_end = bisect_left(range(n), True, lo=today_end, key=lambda i: is_before(i, week_start))
+        return ("Today",) * today_end + ("This Week",) * (week_end - today_end) + ("Older",) * (n - week_end)
+    
+    categories = []
+    for i in range(n):
+        if not is_before(i, today_start):
+            categories.append("Today")
+        elif not is_before(i, week_start):
+            categories.append("This Week")
+        else:
+            categories.append("Older")
+    return tuple(categories)
+
 def categorize_sessions(sessions):
     """Categorize sessions into Today, This Week, and Older"""
-    now = datetime.now()
-    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    week_start = today_start - timedelta(days=now.weekday())
-    
     categorized = {
         "Today": [],
         "This Week": [],
         "Older": []
     }
     
-    for session in sessions:
-        try:
-            last_chat_str = session.get('last_chat_datetime', session.get('updated_at', ''))
-            if last_chat_str:
-                last_chat = datetime.fromisoformat(last_chat_str.replace('Z', '+00:00'))
-                last_chat = last_chat.replace(tzinfo=None)
-                
-                if last_chat >= today_start:
-                    categorized["Today"].append(session)
-                elif last_chat >= week_start:
-                    categorized["This Week"].append(session)
-                else:
-                    categorized["Older"].append(session)
-            else:
-                categorized["Older"].append(session)
-        except Exception:
-            categorized["Older"].append(session)
+    # Timestamps are only parsed when the list (or the day) changes, not on every rerun
+    last_chats = tuple(
+        session.get('last_chat_datetime', session.get('updated_at', '')) for session in sessions
+    )
+    for session, category in zip(sessions, _session_categories(last_chats, date.today())):
+        categorized[category].append(session)
     
     return categorized
 
@@ -284,16 +425,41 @@ def display_welcome_section():
         </div>
     """, unsafe_allow_html=True)
 
-def read_citation_html(citation_path: str) -> str:
-    """Read HTML citation file and return content"""
+@st.cache_data(show_spinner=False, max_entries=256)
+def _read_citation_file(citation_path: str, mtime: float) -> str:
+    """File contents; mtime is part of the cache key so edited files are re-read"""
+    with open(citation_path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+def _load_citation(citation_path: str):
+    """(content, error) for a citation file, content None if it doesn't exist; no st calls"""
     try:
-        if os.path.exists(citation_path):
-            with open(citation_path, 'r', encoding='utf-8') as f:
-                return f.read()
-        return None
+        mtime = os.stat(citation_path).st_mtime  # one stat doubles as the existence check
+    except OSError:
+        return None, None
+    try:
+        return _read_citation_file(citation_path, mtime), None
     except Exception as e:
-        st.error(f"Error reading citation file: {str(e)}")
-        return None
+        return "", e
+
+def read_citation_html(citation_path: str) -> str:
+    """Read HTML citation file and return content (None if the file doesn't exist)"""
+    return read_citation_htmls([citation_path]).get(citation_path)
+
+def read_citation_htmls(citation_paths) -> dict:
+    """read_citation_html for several files at once; the files are read concurrently"""
+    paths = list(dict.fromkeys(p for p in citation_paths if p))
+    if len(paths) > 1:
+        results = background_executor().map(_load_citation, paths)
+    else:
+        results = map(_load_citation, paths)
+    
+    contents = {}
+    for path, (content, error) in zip(paths, results):
+        if error:
+            st.error(f"Error reading citation file: {str(error)}")
+        contents[path] = content
+    return contents
 
 def render_citations(citations):
     """Render citations with HTML content"""
@@ -303,38 +469,35 @@ def render_citations(citations):
     st.markdown("### 📚 Citations")
     st.caption(f"{len(citations)} source{'s' if len(citations) > 1 else ''} found")
     
+    # Read all citation files up front (in parallel) so the loop below only does lookups
+    contents = read_citation_htmls(c.get("citation_path") for c in citations)
+    
     for idx, citation in enumerate(citations, 1):
-        file_id = citation.get("file_id", "Unknown")
         chunk_id = citation.get("chunk_id", "N/A")
         page = citation.get("page", "N/A")
-        header = citation.get("header", "No header")
         citation_path = citation.get("citation_path", "")
         
         # Create citation container
         with st.container():
-            # Citation header
-            header_html = f"""
-            <div class="citation-header">
-                <span style="font-size: 1.2rem;">📄</span>
-                <div>
-                    <div class="citation-title">Source {idx}</div>
-                    <div class="citation-meta">Page: {page} | Chunk: {chunk_id}</div>
-                </div>
-            </div>
-            """
+            # Citation header (single line: st.markdown dedents/strips whatever it is given)
+            header_html = (
+                f'<div class="citation-header"><span style="font-size: 1.2rem;">📄</span><div>'
+                f'<div class="citation-title">Source {idx}</div>'
+                f'<div class="citation-meta">Page: {page} | Chunk: {chunk_id}</div>'
+                f'</div></div>'
+            )
             st.markdown(header_html, unsafe_allow_html=True)
             
             # Read and display citation content
-            if citation_path and os.path.exists(citation_path):
-                html_content = read_citation_html(citation_path)
-                if html_content:
-                    # Display in expander for better organization
-                    with st.expander("📖 View Full Citation", expanded=False):
-                        st.markdown(f'<div class="citation-content">{html_content}</div>', unsafe_allow_html=True)
-                else:
-                    st.warning("Citation content not available")
-            else:
+            html_content = contents.get(citation_path) if citation_path else None
+            if html_content is None:
                 st.warning(f"Citation file not found: {citation_path}")
+            elif html_content:
+                # Display in expander for better organization
+                with st.expander("📖 View Full Citation", expanded=False):
+                    st.markdown(f'<div class="citation-content">{html_content}</div>', unsafe_allow_html=True)
+            else:
+                st.warning("Citation content not available")
             
             st.markdown("---")
 
@@ -355,12 +518,7 @@ def render_metadata(metadata):
         info_parts.append(f"🔍 {metadata['chunks_retrieved']} chunks retrieved")
     
     if info_parts:
-        metadata_html = f"""
-        <div class="metadata-box">
-            {" • ".join(info_parts)}
-        </div>
-        """
-        st.markdown(metadata_html, unsafe_allow_html=True)
+        st.markdown(f'<div class="metadata-box">{" • ".join(info_parts)}</div>', unsafe_allow_html=True)
 
 def display_message_with_metadata(message, role):
     """Display a chat message with optional citations"""
@@ -413,6 +571,7 @@ def main():
         st.divider()
         
         # Fetch sessions if not loaded
+        collect_sessions_refresh()
         if not st.session_state.sessions_list:
             st.session_state.sessions_list = get_all_sessions()
         
@@ -427,11 +586,10 @@ def main():
                     col1, col2 = st.columns([5, 1])
                     
                     with col1:
-                        session_name = session.get('session_name', 'Unnamed Session')
                         is_active = session['session_id'] == st.session_state.current_session_id
                         
                         if st.button(
-                            session_name[:35],
+                            session['display_name'],
                             key=f"session_{session['session_id']}",
                             use_container_width=True,
                             type="primary" if is_active else "secondary"
@@ -447,7 +605,6 @@ def main():
                             type="secondary"
                         ):
                             if delete_session(session['session_id']):
-                                st.session_state.sessions_list = get_all_sessions()
                                 if session['session_id'] == st.session_state.current_session_id:
                                     create_new_session()
                                 st.rerun()
@@ -490,33 +647,26 @@ def main():
         with st.chat_message("user"):
             st.markdown(prompt)
         
-        # Show spinner with assistant message
+        # Stream the answer into the assistant message as it is generated
         with st.chat_message("assistant"):
-            spinner_messages = [
-                "Thinking...",
-                "Searching documents...",
-                "Analyzing context...",
-                "Generating answer..."
-            ]
+            answer_placeholder = st.empty()
+            answer_placeholder.markdown("*Thinking...*")
+            streamed = []
             
-            spinner_placeholder = st.empty()
-            
-            for msg in spinner_messages:
-                spinner_placeholder.markdown(f"*{msg}*")
-                time.sleep(0.5)
+            def show_token(text):
+                streamed.append(text)
+                answer_placeholder.markdown("".join(streamed) + "▌")
             
             # Get response
-            response = send_message(prompt)
-            
-            spinner_placeholder.empty()
+            response = send_message(prompt, on_token=show_token)
             
             if response:
                 # Update session info
                 st.session_state.current_session_id = response["session_id"]
                 st.session_state.current_session_name = response.get("session_name", "New Chat")
                 
-                # Display response
-                st.markdown(response["answer"])
+                # Display response (the final answer replaces the streamed text)
+                answer_placeholder.markdown(response["answer"])
                 
                 # Prepare metadata
                 metadata = {
@@ -528,6 +678,9 @@ def main():
                     "chunks_retrieved": response.get("chunks_retrieved", 0)
                 }
                 
+                # Refresh sessions list while the metadata and citations render
+                refresh_sessions_in_background()
+                
                 # Render metadata
                 render_metadata(metadata)
                 
@@ -543,10 +696,9 @@ def main():
                     "metadata": metadata
                 })
                 
-                # Refresh sessions list
-                st.session_state.sessions_list = get_all_sessions()
                 st.rerun()
             else:
+                answer_placeholder.empty()
                 st.error("Failed to get response from the API")
 
     # Footer
@@ -1,5 +1,9 @@
 from langchain_text_splitters import MarkdownHeaderTextSplitter
 import json
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
 from typing import Dict, List, Tuple, Optional
 import os
@@ -10,6 +14,50 @@ from dotenv import load_dotenv
 load_dotenv()
 
 JSON_FILE = os.getenv("CHUNK_JSON_FILE")
+# Folders are chunked in parallel worker processes (regex/splitter work holds the GIL)
+CHUNK_WORKERS = int(os.getenv("CHUNK_WORKERS", "0")) or os.cpu_count() or 1
+# Reuse a folder's previous chunks while its source files are unchanged
+CHUNK_CACHE_ENABLED = os.getenv("CHUNK_CACHE_ENABLED", "1") == "1"
+CHUNK_CACHE_FILE = '.chunker_cache.json'
+# Bump when chunk_folder output changes so existing caches are ignored
+CHUNK_CACHE_VERSION = 1
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
+
+# Page markers emitted by marker: {page_no}----
+_PAGE_RE = re.compile(r'\{(\d+)\}-+')
+# Markdown image references: ![alt](path)
+_IMG_RE = re.compile(r'!\[.*?\]\((.*?)\)')
+
+@dataclass(slots=True)
+class ChunkMeta:
+    """Chunk metadata; slots keep per-chunk memory and pickled size down vs a dict"""
+    header: Optional[str]
+    subheader: Optional[str]
+    page: str  # Page range like "1", "2-3", etc.
+    chunk_id: str
+    chunk_index: int  # Position in the document (citation ordering)
+    chunk_size: int  # Word count
+    chunk_img_path: Optional[str]  # Markdown reference
+    relative_img_path: Optional[str]  # Full absolute path
+    file_id: str
+    file_path: str  # Full absolute path to .md file
+    folder_path: str  # Full absolute path to folder
+    source: str = 'langchain_markdown_splitter'
+    
+    def to_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+# (text, metadata); converted to {'text': ..., 'metadata': {...}} only when written out
+ChunkRecord = Tuple[str, ChunkMeta]
+
+
+def chunk_to_dict(chunk: ChunkRecord) -> Dict:
+    """Output JSON shape of a chunk"""
+    text, meta = chunk
+    return {'text': text, 'metadata': meta.to_dict()}
+
 
 class DynamicMarkdownChunker:
     """
@@ -34,6 +82,67 @@ class DynamicMarkdownChunker:
         
         self.base_path = self.base_path.resolve()
         print(f"✅ Base folder set to: {self.base_path}")
+        
+        # Folder path -> classified directory listing (see _scan_folder)
+        self._folder_scans: Dict[Path, Dict] = {}
+    
+    def _scan_folder(self, folder_path: Path) -> Dict:
+        """
+        List a document folder once and classify its entries.
+        
+        Args:
+            folder_path: Path to the document folder
+            
+        Returns:
+            Dict with 'md', 'blocks' and 'meta' file paths (None if missing),
+            'stats' with their [mtime_ns, size], and 'images' mapping image
+            names to their paths
+        """
+        folder_path = Path(folder_path)
+        scan = self._folder_scans.get(folder_path)
+        if scan is not None:
+            return scan
+        
+        scan = {'md': None, 'blocks': None, 'meta': None, 'stats': {}, 'images': {}}
+        with os.scandir(folder_path) as entries:
+            for entry in entries:
+                name = entry.name
+                suffix = os.path.splitext(name)[1].lower()
+                if suffix in IMAGE_EXTENSIONS:
+                    scan['images'][name] = Path(entry.path)
+                    continue
+                elif name.startswith('.'):
+                    continue  # glob('*...') never matched hidden files
+                elif name == 'blocks.json':
+                    kind = 'blocks'
+                elif name.endswith('_meta.json'):
+                    kind = 'meta'
+                elif name.endswith('.md'):
+                    kind = 'md'
+                else:
+                    continue
+                
+                if scan[kind] is None:
+                    stat = entry.stat()
+                    scan[kind] = Path(entry.path)
+                    scan['stats'][kind] = [stat.st_mtime_ns, stat.st_size]
+        
+        self._folder_scans[folder_path] = scan
+        return scan
+    
+    @staticmethod
+    def _has_marker_files(folder_path: str) -> bool:
+        """True once the folder is seen to hold both a .md and a .json file"""
+        has_md = has_json = False
+        with os.scandir(folder_path) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                has_md = has_md or entry.name.endswith('.md')
+                has_json = has_json or entry.name.endswith('.json')
+                if has_md and has_json:
+                    return True
+        return False
     
     def discover_document_folders(self) -> List[Path]:
         """
@@ -45,15 +154,12 @@ class DynamicMarkdownChunker:
         """
         doc_folders = []
         
-        for item in self.base_path.iterdir():
-            if item.is_dir():
+        with os.scandir(self.base_path) as entries:
+            for entry in entries:
                 # Check if folder contains marker-generated files
-                has_md = list(item.glob('*.md'))
-                has_json = list(item.glob('*.json'))
-                
-                if has_md and has_json:
-                    doc_folders.append(item)
-                    print(f"  ✓ Found: {item.name}")
+                if entry.is_dir() and self._has_marker_files(entry.path):
+                    doc_folders.append(Path(entry.path))
+                    print(f"  ✓ Found: {entry.name}")
         
         if not doc_folders:
             raise ValueError(
@@ -63,7 +169,7 @@ class DynamicMarkdownChunker:
         
         return sorted(doc_folders)
     
-    def load_folder_files(self, folder_path: Path) -> Tuple[str, Dict, Dict, Path]:
+    def load_folder_files(self, folder_path: Path) -> Tuple[str, Dict, Dict, Path, Path]:
         """
         Load markdown, blocks.json, and metadata from a folder.
         
@@ -71,26 +177,25 @@ class DynamicMarkdownChunker:
             folder_path: Path to the document folder
             
         Returns:
-            Tuple of (md_content, blocks, meta, folder_path)
+            Tuple of (md_content, blocks, meta, folder_path, md_file)
         """
         folder_path = Path(folder_path)
+        scan = self._scan_folder(folder_path)
         
         # Find .md file
-        md_files = list(folder_path.glob('*.md'))
-        if not md_files:
+        md_file = scan['md']
+        if md_file is None:
             raise FileNotFoundError(f"❌ No .md file found in {folder_path}")
-        md_file = md_files[0]
         
         # Find blocks.json
-        blocks_file = folder_path / 'blocks.json'
-        if not blocks_file.exists():
+        blocks_file = scan['blocks']
+        if blocks_file is None:
             raise FileNotFoundError(f"❌ blocks.json not found in {folder_path}")
         
         # Find *_meta.json
-        meta_files = list(folder_path.glob('*_meta.json'))
-        if not meta_files:
+        meta_file = scan['meta']
+        if meta_file is None:
             raise FileNotFoundError(f"❌ No *_meta.json file found in {folder_path}")
-        meta_file = meta_files[0]
         
         # Load files
         try:
@@ -104,28 +209,29 @@ class DynamicMarkdownChunker:
             print(f"  📄 Loaded: {md_file.name}")
             print(f"  📋 Loaded: blocks.json, {meta_file.name}")
             
-            return md_content, blocks, meta, folder_path
+            return md_content, blocks, meta, folder_path, md_file
         
         except Exception as e:
             raise RuntimeError(f"❌ Error loading files from {folder_path}: {e}")
     
-    def get_page_range_from_content(self, chunk_text: str, md_content: str) -> str:
+    def find_chunk_start(self, chunk_text: str, md_content: str, cursor: int = 0) -> Tuple[int, int]:
         """
-        Extract page range from markdown content based on chunk position.
-        Searches for {page_no}---- pattern before and after the chunk.
+        Locate a chunk's offset in the markdown content.
+        The splitter emits chunks in document order, so the search starts at
+        the previous chunk's anchor instead of the top of the document.
         
         Args:
             chunk_text: The text content of the chunk
             md_content: Full markdown content
+            cursor: Offset past the previous chunk's anchor
             
         Returns:
-            Page range as string (e.g., "0", "1", "2-3", "5-7")
+            Tuple of (offset of the chunk in md_content, or cursor if not found;
+            length of the matched anchor text, 0 if not found)
         """
-        # Clean chunk text for better matching (first 200 chars)
-        chunk_sample = chunk_text[:200].strip() if len(chunk_text) > 200 else chunk_text.strip()
-        
-        # Find the position of chunk text in markdown
-        chunk_start = md_content.find(chunk_sample)
+        # A short prefix is enough to anchor the chunk past the cursor
+        needle = chunk_text[:64].strip()
+        chunk_start = md_content.find(needle, cursor)
         
         # If not found, try without leading/trailing whitespace variations
         if chunk_start == -1:
@@ -134,36 +240,63 @@ class DynamicMarkdownChunker:
             for line in lines[:5]:  # Try first 5 lines
                 line_clean = line.strip()
                 if len(line_clean) > 20:  # Only use substantial lines
-                    chunk_start = md_content.find(line_clean)
+                    chunk_start = md_content.find(line_clean, cursor)
                     if chunk_start != -1:
+                        needle = line_clean
                         break
         
         if chunk_start == -1:
-            return "0"
-        
-        # Get text before chunk to find start page
-        text_before = md_content[:chunk_start]
+            return cursor, 0
+        return chunk_start, len(needle)
+    
+    def get_page_markers(self, md_content: str) -> Tuple[List[Tuple[int, int]], List[int]]:
+        """
+        Scan the markdown once for {page_no}---- markers.
         
-        # Find all page markers before chunk: {page_no}----
-        page_pattern = r'\{(\d+)\}-+'
-        pages_before = re.findall(page_pattern, text_before)
+        Args:
+            md_content: Full markdown content
+            
+        Returns:
+            Tuple of (page_markers, offsets): (start offset, page_no) pairs in
+            document order, and the offset where each marker becomes a full match
+            ("{n}-"), which is what a marker split at a chunk boundary needs
+        """
+        matches = list(_PAGE_RE.finditer(md_content))
+        page_markers = [(m.start(), int(m.group(1))) for m in matches]
+        offsets = [m.end(1) + 2 for m in matches]
+        return page_markers, offsets
+    
+    def get_page_range_from_content(
+        self,
+        chunk_start: int,
+        chunk_len: int,
+        page_markers: List[Tuple[int, int]],
+        offsets: List[int]
+    ) -> str:
+        """
+        Page range of a chunk from the page markers around its position.
         
+        Args:
+            chunk_start: Offset of the chunk in the markdown
+            chunk_len: Length of the chunk text
+            page_markers: (offset, page_no) pairs from get_page_markers
+            offsets: Marker match offsets from get_page_markers
+            
+        Returns:
+            Page range as string (e.g., "0", "1", "2-3", "5-7")
+        """
         # Start page is the last page marker before chunk, or 0 if none
-        start_page = int(pages_before[-1]) if pages_before else 0
+        before = bisect_right(offsets, chunk_start) - 1
+        start_page = page_markers[before][1] if before >= 0 else 0
         
-        # Get text for chunk to find end page
-        chunk_end = chunk_start + len(chunk_text)
-        text_in_chunk = md_content[chunk_start:chunk_end]
+        # Skip a marker straddling the chunk start; it counts on neither side
+        first = before + 1
+        if first < len(page_markers) and page_markers[first][0] < chunk_start:
+            first += 1
         
-        # Find all page markers within chunk
-        pages_in_chunk = re.findall(page_pattern, text_in_chunk)
-        
-        if pages_in_chunk:
-            # If chunk contains page markers, end page is the last one found
-            end_page = int(pages_in_chunk[-1])
-        else:
-            # If no page markers in chunk, use start page
-            end_page = start_page
+        # End page is the last page marker within the chunk, or the start page if none
+        last = bisect_right(offsets, chunk_start + chunk_len) - 1
+        end_page = page_markers[last][1] if last >= first else start_page
         
         # Format page range
         if start_page == end_page:
@@ -181,14 +314,7 @@ class DynamicMarkdownChunker:
         Returns:
             Dict mapping image names to their full paths
         """
-        image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
-        images = {}
-        
-        for img_file in folder_path.iterdir():
-            if img_file.suffix.lower() in image_extensions:
-                images[img_file.name] = img_file
-        
-        return images
+        return self._scan_folder(folder_path)['images']
     
     def extract_images_from_markdown(self, text: str) -> List[str]:
         """
@@ -200,14 +326,16 @@ class DynamicMarkdownChunker:
         Returns:
             List of image paths referenced in markdown
         """
-        img_matches = re.findall(r'!\[.*?\]\((.*?)\)', text)
+        if '![' not in text:
+            return []  # Most chunks have no images; skip the regex
+        img_matches = _IMG_RE.findall(text)
         return img_matches
     
     def resolve_image_paths(
         self,
         chunk_img_paths: List[str],
         folder_path: Path,
-        available_images: Dict[str, Path]
+        available_images: Dict[str, str]
     ) -> Dict[str, Optional[str]]:
         """
         Resolve chunk image paths to actual filesystem paths.
@@ -215,7 +343,7 @@ class DynamicMarkdownChunker:
         Args:
             chunk_img_paths: Image paths found in markdown
             folder_path: Document folder path
-            available_images: Available image files in folder
+            available_images: Available image names mapped to their resolved paths
             
         Returns:
             Dict with chunk_img_path and relative_img_path (as full absolute path)
@@ -235,15 +363,12 @@ class DynamicMarkdownChunker:
         # Extract filename from path (handle various formats)
         img_filename = Path(chunk_img_path).name
         
-        # Find matching actual image file
-        if img_filename in available_images:
-            actual_img_path = available_images[img_filename]
-            # Use full absolute path
-            result['relative_img_path'] = str(actual_img_path.resolve())
+        # Find matching actual image file (full absolute path)
+        result['relative_img_path'] = available_images.get(img_filename)
         
         return result
     
-    def chunk_folder(self, folder_path: Path) -> Tuple[List[Dict], Dict]:
+    def chunk_folder(self, folder_path: Path) -> Tuple[List[ChunkRecord], Dict]:
         """
         Process a single folder: load, chunk, and enrich with metadata.
         
@@ -256,8 +381,10 @@ class DynamicMarkdownChunker:
         print(f"\n📂 Processing: {folder_path.name}")
         
         # Load files
-        md_content, blocks, meta, _ = self.load_folder_files(folder_path)
+        md_content, blocks, meta, _, md_file_path = self.load_folder_files(folder_path)
         file_id = 'fi_' + str(uuid.uuid4())
+        # Chunk ids: one random prefix per document plus the chunk index
+        chunk_prefix = 'chk_' + uuid.uuid4().hex[:12]
         
         # Discover images
         available_images = self.find_images_in_folder(folder_path)
@@ -281,113 +408,240 @@ class DynamicMarkdownChunker:
         md_docs = markdown_splitter.split_text(md_content)
         print(f"  ✂️  Split into {len(md_docs)} chunks")
         
-        # Get the .md file path
-        md_file_path = list(folder_path.glob('*.md'))[0]
+        # Page markers, scanned once for all chunks
+        page_markers, offsets = self.get_page_markers(md_content)
+        
+        # Absolute paths, resolved once for all chunks
+        md_file_str = str(md_file_path.resolve())
+        folder_str = str(folder_path.resolve())
+        resolved_images = {name: str(path.resolve()) for name, path in available_images.items()}
         
         # Process chunks
         chunks = []
+        cursor = 0
         for doc in md_docs:
-            metadata = doc.metadata.copy()
+            text = doc.page_content.strip()
+            if not text:
+                continue  # Whitespace-only section, nothing to index
+            metadata = doc.metadata
             
             # Get page range from content
-            page_range = self.get_page_range_from_content(doc.page_content, md_content)
+            chunk_start, anchor_len = self.find_chunk_start(doc.page_content, md_content, cursor)
+            # Advance only past the matched anchor: the splitter re-joins lines
+            # with "  \n", so page_content can be longer than its source span
+            cursor = max(cursor, chunk_start + anchor_len)
+            page_range = self.get_page_range_from_content(
+                chunk_start,
+                len(doc.page_content),
+                page_markers,
+                offsets
+            )
             
             # Extract and resolve image paths
             chunk_img_paths = self.extract_images_from_markdown(doc.page_content)
             image_data = self.resolve_image_paths(
                 chunk_img_paths,
                 folder_path,
-                available_images
+                resolved_images
             )
             
-            chunk = {
-                'text': doc.page_content.strip(),
-                'metadata': {
-                    'header': metadata.get('header'),
-                    'subheader': metadata.get('subheader'),
-                    'page': page_range,  # Now returns range like "1", "2-3", etc.
-                    'chunk_id': 'chk_' + str(uuid.uuid4()),
-                    'chunk_size': len(doc.page_content.split()),  # Word count
-                    'chunk_img_path': image_data['chunk_img_path'],  # Markdown reference
-                    'relative_img_path': image_data['relative_img_path'],  # Full absolute path
-                    'file_id': file_id,  # Generate UUID for each chunk
-                    'file_path': str(md_file_path.resolve()),  # Full absolute path to .md file
-                    'folder_path': str(folder_path.resolve()),  # Full absolute path to folder
-                    'source': 'langchain_markdown_splitter'
-                }
-            }
-            
-            if chunk['text'].strip():
-                chunks.append(chunk)
+            chunks.append((text, ChunkMeta(
+                header=metadata.get('header'),
+                subheader=metadata.get('subheader'),
+                page=page_range,
+                chunk_id=f'{chunk_prefix}{len(chunks):06x}',
+                chunk_index=len(chunks),
+                chunk_size=len(text.split()),
+                chunk_img_path=image_data['chunk_img_path'],
+                relative_img_path=image_data['relative_img_path'],
+                file_id=file_id,
+                file_path=md_file_str,
+                folder_path=folder_str
+            )))
         
         # Prepare folder metadata
         folder_metadata = {
             'folder_name': folder_path.name,
-            'folder_path': str(folder_path.resolve()),  # Full absolute path
+            'folder_path': folder_str,  # Full absolute path
             'total_chunks': len(chunks),
-            'avg_chunk_size': sum(c['metadata']['chunk_size'] for c in chunks) / len(chunks) if chunks else 0,
+            'avg_chunk_size': sum(meta.chunk_size for _, meta in chunks) / len(chunks) if chunks else 0,
             'total_images': len(available_images),
             'metadata': meta
         }
         
         return chunks, folder_metadata
     
-    def process_all_folders(self, output_file: str = JSON_FILE) -> Dict:
+    def _folder_signature(self, folder_path: Path) -> Optional[List]:
+        """
+        Cache key for a folder's chunks: source file stats, location and image set.
+        
+        Args:
+            folder_path: Path to document folder
+            
+        Returns:
+            JSON-comparable signature, or None if a source file is missing
+        """
+        scan = self._scan_folder(folder_path)
+        if scan['md'] is None or scan['blocks'] is None or scan['meta'] is None:
+            return None
+        
+        return [
+            CHUNK_CACHE_VERSION,
+            str(scan['md'].resolve()),
+            scan['stats']['md'],
+            scan['stats']['blocks'],
+            scan['stats']['meta'],
+            sorted(scan['images'])
+        ]
+    
+    def chunk_folder_cached(self, folder_path: Path) -> Tuple[List[ChunkRecord], Dict]:
+        """
+        chunk_folder, reusing the previous run's output while the folder is unchanged.
+        Cached chunks keep their ids, so ingestion skips them as already processed.
+        
+        Args:
+            folder_path: Path to document folder
+            
+        Returns:
+            Tuple of (chunks, folder_metadata)
+        """
+        folder_path = Path(folder_path)
+        cache_file = folder_path / CHUNK_CACHE_FILE
+        signature = self._folder_signature(folder_path)
+        
+        if signature is not None and cache_file.exists():
+            try:
+                with open(cache_file, 'r', encoding='utf-8') as f:
+                    cached = json.load(f)
+                if cached.get('signature') == signature:
+                    print(f"\n♻️  Unchanged, reusing cached chunks: {folder_path.name}")
+                    chunks = [(c['text'], ChunkMeta(**c['metadata'])) for c in cached['chunks']]
+                    return chunks, cached['folder_metadata']
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                print(f"  ⚠️  Ignoring unreadable chunk cache in {folder_path.name}: {e}")
+        
+        chunks, folder_metadata = self.chunk_folder(folder_path)
+        
+        if signature is not None:
+            try:
+                with open(cache_file, 'w', encoding='utf-8') as f:
+                    json.dump(
+                        {
+                            'signature': signature,
+                            'chunks': [chunk_to_dict(c) for c in chunks],
+                            'folder_metadata': folder_metadata
+                        },
+                        f,
+                        ensure_ascii=False
+                    )
+            except OSError as e:
+                print(f"  ⚠️  Could not write chunk cache for {folder_path.name}: {e}")
+        
+        return chunks, folder_metadata
+    
+    def _chunk_folders(self, doc_folders: List[Path], workers: int, use_cache: bool):
+        """
+        Yield (folder, chunk_folder result or exception) in folder order.
+        Folders are chunked in a process pool, with at most two per worker
+        in flight so finished results don't pile up ahead of the writer.
+        """
+        chunk = self.chunk_folder_cached if use_cache else self.chunk_folder
+        if workers <= 1 or len(doc_folders) <= 1:
+            for folder in doc_folders:
+                try:
+                    yield folder, chunk(folder)
+                except Exception as e:
+                    yield folder, e
+            return
+        
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            folders = iter(doc_folders)
+            for folder in folders:
+                pending.append((folder, executor.submit(chunk, folder)))
+                if len(pending) >= 2 * workers:
+                    break
+            while pending:
+                folder, future = pending.popleft()
+                try:
+                    yield folder, future.result()
+                except Exception as e:
+                    yield folder, e
+                next_folder = next(folders, None)
+                if next_folder is not None:
+                    pending.append((next_folder, executor.submit(chunk, next_folder)))
+    
+    def process_all_folders(
+        self,
+        output_file: str = JSON_FILE,
+        workers: int = CHUNK_WORKERS,
+        use_cache: bool = CHUNK_CACHE_ENABLED
+    ) -> Dict:
         """
         Process all discovered folders and create consolidated output.
+        Folders are chunked in parallel processes and written to the output file
+        in folder order as they complete, so only a few folders' chunks are held
+        in memory at a time.
         
         Args:
             output_file: Output JSON file path
+            workers: Worker processes for chunking (1 = serial)
+            use_cache: Reuse cached chunks of unchanged folders
             
         Returns:
-            Complete output dictionary
+            Summary dictionary (output file, chunk count, per-folder metadata)
         """
         print(f"\n🔍 Discovering folders in {self.base_path.name}...")
         doc_folders = self.discover_document_folders()
         print(f"✅ Found {len(doc_folders)} document folders\n")
         
-        all_chunks = []
+        total_chunks = 0
+        sample_chunks = []
         folders_metadata = []
         
-        for folder in doc_folders:
-            try:
-                chunks, folder_meta = self.chunk_folder(folder)
-                all_chunks.extend(chunks)
-                folders_metadata.append(folder_meta)
-            except Exception as e:
-                print(f"  ⚠️  Error processing {folder.name}: {e}")
-                continue
-        
-        # Create consolidated output
-        output = {
-            'chunks': all_chunks
-        }
-        
-        # Save output
+        # Same {"chunks": [...]} document as before, one chunk per line
         with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(output, f, indent=2, ensure_ascii=False)
+            f.write('{"chunks": [')
+            for folder, result in self._chunk_folders(doc_folders, workers, use_cache):
+                if isinstance(result, Exception):
+                    print(f"  ⚠️  Error processing {folder.name}: {result}")
+                    continue
+                chunks, folder_meta = result
+                
+                for chunk in chunks:
+                    f.write('\n' if total_chunks == 0 else ',\n')
+                    f.write(json.dumps(chunk_to_dict(chunk), ensure_ascii=False))
+                    total_chunks += 1
+                
+                sample_chunks.extend(chunks[:3 - len(sample_chunks)])
+                folders_metadata.append(folder_meta)
+            f.write('\n]}\n')
         
-        print(f"\n✅ SUCCESS! Created {len(all_chunks)} chunks from {len(doc_folders)} folders")
+        print(f"\n✅ SUCCESS! Created {total_chunks} chunks from {len(doc_folders)} folders")
         print(f"💾 Saved to: {output_file}\n")
         
-        self._print_sample_chunks(all_chunks)
+        self._print_sample_chunks(sample_chunks)
         
-        return output
+        return {
+            'output_file': output_file,
+            'total_chunks': total_chunks,
+            'folders': folders_metadata
+        }
     
-    def _print_sample_chunks(self, chunks: List[Dict], num_samples: int = 3):
+    def _print_sample_chunks(self, chunks: List[ChunkRecord], num_samples: int = 3):
         """Print sample chunks for verification."""
         print(f"📋 Sample chunks (showing hierarchy preservation):")
-        for i, chunk in enumerate(chunks[:num_samples]):
+        for i, (text, meta) in enumerate(chunks[:num_samples]):
             print(f"\n--- Chunk {i+1} ---")
-            print(f"Chunk ID: {chunk['metadata']['chunk_id']}")
-            print(f"File ID: {chunk['metadata']['file_id']}")
-            print(f"Folder: {Path(chunk['metadata']['folder_path']).name}")
-            print(f"Header: {chunk['metadata']['header']}")
-            print(f"Subheader: {chunk['metadata']['subheader']}")
-            print(f"Page Range: {chunk['metadata']['page']}")
-            print(f"Chunk img path: {chunk['metadata']['chunk_img_path']}")
-            print(f"Text preview: {chunk['text'][:150]}...")
-            print(f"Size: {chunk['metadata']['chunk_size']} words")
+            print(f"Chunk ID: {meta.chunk_id}")
+            print(f"File ID: {meta.file_id}")
+            print(f"Folder: {Path(meta.folder_path).name}")
+            print(f"Header: {meta.header}")
+            print(f"Subheader: {meta.subheader}")
+            print(f"Page Range: {meta.page}")
+            print(f"Chunk img path: {meta.chunk_img_path}")
+            print(f"Text preview: {text[:150]}...")
+            print(f"Size: {meta.chunk_size} words")
         
         print("\n🚀 Ready for Milvus/LangChain vector DB ingestion!")
 
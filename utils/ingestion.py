@@ -3,6 +3,8 @@ import os
 from typing import List, Set
 from dotenv import load_dotenv
 
+import ijson
+
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_milvus import Milvus
 from langchain_core.documents import Document
@@ -16,6 +18,15 @@ LOG_FILE = os.getenv("INGESTION_LOG_FILE", "ingestion_log.json")
 MILVUS_URI = os.getenv("MILVUS_URI", "http://localhost:19530")
 COLLECTION_NAME = os.getenv("COLLECTION_NAME", "knowledge_base_v1")
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L12-v2")
+# Index built on a new collection; must match the retriever's search metric
+MILVUS_METRIC_TYPE = os.getenv("MILVUS_METRIC_TYPE", "IP")
+MILVUS_SEARCH_EF = int(os.getenv("MILVUS_SEARCH_EF", "50"))
+# Documents embedded and inserted per add_documents call
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))
+# Texts per encoder forward pass inside a batch
+INGEST_ENCODE_BATCH_SIZE = int(os.getenv("INGEST_ENCODE_BATCH_SIZE", "128"))
+# "cuda", "cpu", ... ; empty picks cuda when available. fp16 is only used on GPU
+INGEST_DEVICE = os.getenv("INGEST_DEVICE", "")
 
 print("Configuration loaded:")
 print(f"JSON_FILE: {JSON_FILE}")
@@ -23,25 +34,49 @@ print(f"LOG_FILE: {LOG_FILE}")
 print(f"MILVUS_URI: {MILVUS_URI}")
 print(f"COLLECTION_NAME: {COLLECTION_NAME}")
 print(f"EMBEDDING_MODEL: {EMBEDDING_MODEL}")
+print(f"MILVUS_METRIC_TYPE: {MILVUS_METRIC_TYPE}")
+print(f"INGEST_BATCH_SIZE: {INGEST_BATCH_SIZE}")
+print(f"INGEST_ENCODE_BATCH_SIZE: {INGEST_ENCODE_BATCH_SIZE}")
 
 def load_processed_ids() -> Set[str]:
-    """Load the set of already processed chunk IDs from the log file."""
+    """Load the set of already processed chunk IDs from the log file (one ID per line)."""
     if not os.path.exists(LOG_FILE):
         return set()
-    try:
-        with open(LOG_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            return set(data.get("processed_chunk_ids", []))
-    except json.JSONDecodeError:
-        return set()
+    with open(LOG_FILE, "r", encoding="utf-8") as f:
+        content = f.read()
+
+    if content.lstrip().startswith("{"):
+        # Legacy {"processed_chunk_ids": [...]} log: convert it once
+        try:
+            ids = set(json.loads(content).get("processed_chunk_ids", []))
+        except json.JSONDecodeError:
+            return set()
+        with open(LOG_FILE, "w", encoding="utf-8") as f:
+            f.writelines(i + "\n" for i in ids)
+        return ids
+
+    return {line.strip() for line in content.splitlines() if line.strip()}
 
 def save_processed_ids(new_ids: Set[str]):
-    """Update the log file with newly processed IDs."""
-    existing_ids = load_processed_ids()
-    updated_ids = existing_ids.union(new_ids)
-    
-    with open(LOG_FILE, "w", encoding="utf-8") as f:
-        json.dump({"processed_chunk_ids": list(updated_ids)}, f, indent=2)
+    """Append newly processed IDs to the log file."""
+    with open(LOG_FILE, "a", encoding="utf-8") as f:
+        f.writelines(i + "\n" for i in new_ids)
+
+# Chunk metadata schema written by utils/dynamic_chunker.py
+METADATA_STRING_KEYS = (
+    "header", "subheader", "page", "chunk_id", "chunk_img_path", "relative_img_path",
+    "file_id", "file_path", "folder_path", "source",
+)
+METADATA_INT_KEYS = ("chunk_index", "chunk_size")
+_METADATA_KEYS = frozenset(METADATA_STRING_KEYS + METADATA_INT_KEYS)
+
+def _clean_value(v):
+    if v is None:
+        return ""
+    if isinstance(v, (str, int, float, bool)):
+        return v
+    # Convert lists/dicts to string representation if necessary
+    return str(v)
 
 def clean_metadata(metadata: dict) -> dict:
     """
@@ -49,92 +84,132 @@ def clean_metadata(metadata: dict) -> dict:
     - Converts None values to empty strings (Milvus doesn't like None for string fields).
     - Ensures all values are simple types (str, int, float, bool).
     """
-    clean = {}
-    for k, v in metadata.items():
-        if v is None:
-            clean[k] = ""
-        elif isinstance(v, (str, int, float, bool)):
-            clean[k] = v
-        else:
-            # Convert lists/dicts to string representation if necessary
-            clean[k] = str(v)
-    return clean
-
-def main():
-    # 1. Load Data
-    print(f"Loading data from {JSON_FILE}...")
-    try:
-        with open(JSON_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            chunks = data.get("chunks", [])
-    except FileNotFoundError:
-        print(f"Error: {JSON_FILE} not found.")
-        return
-
-    # 2. Filter Processed Chunks
-    processed_ids = load_processed_ids()
-    documents_to_ingest = []
-    new_chunk_ids = set()
-
-    print(f"Found {len(chunks)} total chunks. Checking log for duplicates...")
-
-    for chunk in chunks:
-        # Extract ID and Text
-        meta = chunk.get("metadata", {})
-        chunk_id = meta.get("chunk_id")
-        text_content = chunk.get("text")
-
-        if not chunk_id or not text_content:
-            continue  # Skip invalid chunks
-
-        # Skip if already in log
-        if chunk_id in processed_ids:
-            continue
-
-        # Prepare Document for LangChain
-        # We clean metadata to avoid 'NoneType' errors in Milvus
-        clean_meta = clean_metadata(meta)
-        
-        doc = Document(
-            page_content=text_content,
-            metadata=clean_meta
-        )
-        documents_to_ingest.append(doc)
-        new_chunk_ids.add(chunk_id)
-
-    if not documents_to_ingest:
-        print("All chunks have already been ingested. Nothing to do.")
-        return
-
-    print(f"Preparing to ingest {len(documents_to_ingest)} new chunks...")
-
-    # 3. Initialize Embeddings & Vector Store
-    print(f"Initializing embedding model ({EMBEDDING_MODEL})...")
-    embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+    if metadata.keys() == _METADATA_KEYS:
+        # Known chunker schema: values of the expected type pass straight through
+        clean = {}
+        for k in METADATA_INT_KEYS:
+            v = metadata[k]
+            clean[k] = v if type(v) is int else _clean_value(v)
+        for k in METADATA_STRING_KEYS:
+            v = metadata[k]
+            clean[k] = v if type(v) is str else _clean_value(v)
+        return clean
+
+    return {k: _clean_value(v) for k, v in metadata.items()}
+
+def embedding_model_kwargs() -> dict:
+    """SentenceTransformer kwargs: GPU with fp16 weights when available, else fp32 on CPU."""
+    import torch
+
+    device = INGEST_DEVICE or ("cuda" if torch.cuda.is_available() else "cpu")
+    if not device.startswith("cuda"):
+        return {"device": device}
+    return {"device": device, "model_kwargs": {"torch_dtype": torch.float16}}
+
+def create_vector_store() -> Milvus:
+    """Load the embedding model and connect to the target collection."""
+    model_kwargs = embedding_model_kwargs()
+    print(f"Initializing embedding model ({EMBEDDING_MODEL}) on {model_kwargs['device']}...")
+    embeddings = HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL,
+        model_kwargs=model_kwargs,
+        encode_kwargs={
+            "normalize_embeddings": True,  # unit vectors: IP metric == cosine
+            "batch_size": INGEST_ENCODE_BATCH_SIZE,
+        },
+    )
 
     print(f"Connecting to Milvus at {MILVUS_URI}...")
-    vector_store = Milvus(
+    return Milvus(
         embedding_function=embeddings,
         connection_args={"uri": MILVUS_URI},
         collection_name=COLLECTION_NAME,
         auto_id=True,  # Milvus will generate primary keys, we store chunk_id in metadata
-        drop_old=False # Important: Append to existing collection, don't delete it
+        drop_old=False, # Important: Append to existing collection, don't delete it
+        # Same HNSW parameters as utils/milvus_index.py (langchain-milvus would default to L2)
+        index_params={
+            "index_type": "HNSW",
+            "metric_type": MILVUS_METRIC_TYPE,
+            "params": {"M": 16, "efConstruction": 200},
+        },
+        search_params={"metric_type": MILVUS_METRIC_TYPE, "params": {"ef": MILVUS_SEARCH_EF}},
     )
 
-    # 4. Ingest Data
-    # We ingest in batches to be safe, though LangChain handles this well
-    try:
-        print("Ingesting documents into Milvus...")
+def main():
+    processed_ids = load_processed_ids()
+    vector_store = None  # created on the first batch, so a no-op run skips model loading
+    documents_to_ingest: List[Document] = []
+    new_chunk_ids = set()
+    total_chunks = 0
+    ingested = 0
+
+    def flush():
+        """Ingest the pending batch and log its IDs, so a failed run resumes after it"""
+        nonlocal vector_store, ingested
+        if vector_store is None:
+            vector_store = create_vector_store()
+            print("Ingesting documents into Milvus...")
         vector_store.add_documents(documents_to_ingest)
-        print("Ingestion complete!")
-
-        # 5. Update Log File
-        print("Updating log file...")
         save_processed_ids(new_chunk_ids)
-        print(f"Successfully logged {len(new_chunk_ids)} new chunks to {LOG_FILE}.")
+        processed_ids.update(new_chunk_ids)
+        ingested += len(documents_to_ingest)
+        print(f"  Ingested {ingested} new chunks so far")
+        documents_to_ingest.clear()
+        new_chunk_ids.clear()
 
+    # 1. Stream chunks from the file, one at a time
+    print(f"Loading data from {JSON_FILE}...")
+    try:
+        with open(JSON_FILE, "rb") as f:
+            # use_float: plain floats rather than Decimal, as json.load returned
+            for chunk in ijson.items(f, "chunks.item", use_float=True):
+                total_chunks += 1
+
+                # 2. Filter Processed Chunks
+                # Extract ID and Text
+                meta = chunk.get("metadata", {})
+                chunk_id = meta.get("chunk_id")
+                text_content = chunk.get("text")
+
+                if not chunk_id or not text_content:
+                    continue  # Skip invalid chunks
+
+                # Skip if already in log (or repeated within this file)
+                if chunk_id in processed_ids or chunk_id in new_chunk_ids:
+                    continue
+
+                # Prepare Document for LangChain
+                # We clean metadata to avoid 'NoneType' errors in Milvus
+                clean_meta = clean_metadata(meta)
+
+                doc = Document(
+                    page_content=text_content,
+                    metadata=clean_meta
+                )
+                documents_to_ingest.append(doc)
+                new_chunk_ids.add(chunk_id)
+
+                # 3. Ingest Data in batches
+                if len(documents_to_ingest) >= INGEST_BATCH_SIZE:
+                    flush()
+
+            if documents_to_ingest:
+                flush()
+    except FileNotFoundError:
+        print(f"Error: {JSON_FILE} not found.")
+        return
     except Exception as e:
         print(f"An error occurred during ingestion: {e}")
+        print(f"{ingested} new chunks were ingested and logged to {LOG_FILE} before the error.")
+        return
+
+    print(f"Found {total_chunks} total chunks.")
+    if not ingested:
+        print("All chunks have already been ingested. Nothing to do.")
+        return
+
+    print("Ingestion complete!")
+    print(f"Successfully logged {ingested} new chunks to {LOG_FILE}.")
 
 if __name__ == "__main__":
     main()
@@ -17,23 +17,11 @@ def run_marker_command():
     try:
         print("Running command:")
         print(" ".join(command))
-        print("-" * 50)
-        
-        # Run the command and capture output
-        result = subprocess.run(
-            command,
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        
-        # Print stdout
-        if result.stdout:
-            print(result.stdout)
+        print("-" * 50, flush=True)  # before marker writes to the same stream
         
-        # Print stderr (debug info often goes here)
-        if result.stderr:
-            print(result.stderr)
+        # Run the command; marker writes to our stdout/stderr directly, so
+        # progress shows live and its debug logs aren't buffered in memory
+        subprocess.run(command, check=True)
             
         print("-" * 50)
         print("parsing completed successfully!")
@@ -42,10 +30,6 @@ def run_marker_command():
     except subprocess.CalledProcessError as e:
         print(f"Error running command: {e}")
         print(f"Return code: {e.returncode}")
-        if e.stdout:
-            print(f"Output: {e.stdout}")
-        if e.stderr:
-            print(f"Error output: {e.stderr}")
         return 1
         
     except FileNotFoundError:
@@ -0,0 +1,74 @@
+import argparse
+import math
+import os
+import sys
+from dotenv import load_dotenv
+
+from pymilvus import connections, Collection
+
+load_dotenv()
+
+MILVUS_URI = os.getenv("MILVUS_URI", "http://localhost:19530")
+COLLECTION_NAME = os.getenv("COLLECTION_NAME", "knowledge_base_v1")
+# Vectors are unit-normalized at ingestion and query time, so IP == cosine.
+# Collections indexed with L2 keep it until rebuilt: python -m utils.milvus_index --metric IP
+MILVUS_METRIC_TYPE = os.getenv("MILVUS_METRIC_TYPE", "IP")
+VECTOR_FIELD = "vector"
+
+# HNSW graph parameters (search-time ef is set by MILVUS_SEARCH_EF in the retriever)
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 200
+
+
+def build_index_params(index_type: str, metric_type: str, num_entities: int) -> dict:
+    """
+    Index parameters for the knowledge base collection.
+
+    - HNSW: default, log-n search for small/medium collections
+    - HNSW_SQ: HNSW over 8-bit scalar quantized vectors (~4x less memory)
+    - IVF_PQ: for the >1M vector tier, nlist ~ 4 * sqrt(N)
+    """
+    if index_type == "HNSW":
+        params = {"M": HNSW_M, "efConstruction": HNSW_EF_CONSTRUCTION}
+    elif index_type == "HNSW_SQ":
+        params = {"M": HNSW_M, "efConstruction": HNSW_EF_CONSTRUCTION, "sq_type": "SQ8"}
+    elif index_type == "IVF_PQ":
+        nlist = max(1, int(4 * math.sqrt(max(num_entities, 1))))
+        params = {"nlist": nlist, "m": 16, "nbits": 8}
+    else:
+        raise ValueError(f"Unsupported index type: {index_type}")
+
+    return {"index_type": index_type, "metric_type": metric_type, "params": params}
+
+
+def rebuild_index(index_type: str = "HNSW", metric_type: str = MILVUS_METRIC_TYPE):
+    """Drop the existing vector index and build a new one, then reload the collection."""
+    connections.connect(alias="default", uri=MILVUS_URI)
+    col = Collection(COLLECTION_NAME)
+
+    index_params = build_index_params(index_type, metric_type, col.num_entities)
+    print(f"Collection: {COLLECTION_NAME} ({col.num_entities} entities)")
+    print(f"New index: {index_params}")
+
+    col.release()
+    for index in col.indexes:
+        if index.field_name == VECTOR_FIELD:
+            print(f"Dropping existing index: {index.params}")
+            col.drop_index(index_name=index.index_name)
+
+    col.create_index(VECTOR_FIELD, index_params)
+    col.load()
+    print("Index rebuilt and collection loaded.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the Milvus vector index")
+    parser.add_argument("--index-type", default="HNSW", choices=["HNSW", "HNSW_SQ", "IVF_PQ"])
+    parser.add_argument("--metric", default=MILVUS_METRIC_TYPE, choices=["L2", "IP", "COSINE"])
+    args = parser.parse_args()
+
+    try:
+        rebuild_index(args.index_type, args.metric)
+    except Exception as e:
+        print(f"Error rebuilding index: {e}")
+        sys.exit(1)
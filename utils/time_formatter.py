@@ -1,12 +1,33 @@
 # utils/time_formatter.py 
+from bisect import bisect_right
 from datetime import datetime, timezone, timedelta
+from functools import lru_cache
 
-def get_time_ago(timestamp):
+# (exclusive upper bound in seconds, formatter), ascending
+_BUCKETS = (
+    (60, lambda s: "just now"),
+    (120, lambda s: "1 minute ago"),
+    (3600, lambda s: f"{int(s / 60)} minutes ago"),  # Less than 1 hour
+    (7200, lambda s: "1 hour ago"),  # Less than 2 hours
+    (86400, lambda s: f"{int(s / 3600)} hours ago"),  # Less than 1 day
+    (172800, lambda s: "yesterday"),  # Less than 2 days
+    (604800, lambda s: f"{int(s / 86400)} days ago"),  # Less than 1 week
+    (1209600, lambda s: "1 week ago"),  # Less than 2 weeks
+    (2592000, lambda s: f"{int(s / 604800)} weeks ago"),  # Less than 30 days
+    (5184000, lambda s: "1 month ago"),  # Less than 60 days
+    (31536000, lambda s: f"{int(s / 2592000)} months ago"),  # Less than 1 year
+    (63072000, lambda s: "1 year ago"),  # Less than 2 years
+    (float("inf"), lambda s: f"{int(s / 31536000)} years ago"),
+)
+_THRESHOLDS = tuple(bound for bound, _ in _BUCKETS)
+
+def get_time_ago(timestamp, now=None):
     """
     Simple time ago function.
     
     Args:
         timestamp: datetime object
+        now: aware "now" to compare against; batch callers pass one for all rows
     
     Returns:
         String like "2 minutes ago", "3 hours ago", etc.
@@ -18,47 +39,25 @@ def get_time_ago(timestamp):
     if timestamp.tzinfo is None:
         timestamp = timestamp.replace(tzinfo=timezone.utc)
     
-    now = datetime.now(timezone.utc)
-    diff = now - timestamp
+    if now is None:
+        now = datetime.now(timezone.utc)
+    # Whole elapsed minutes, floored from the exact difference: every bucket
+    # boundary is a multiple of 60 s, so this matches the per-second labels
+    elapsed_minutes = int((now - timestamp).total_seconds() // 60)
+    return get_time_ago_cached(elapsed_minutes)
+
+
+@lru_cache(maxsize=4096)
+def get_time_ago_cached(elapsed_minutes):
+    """
+    Minute-resolution time ago, memoized for session listings.
     
+    Keyed on elapsed whole minutes, so cached strings never go stale.
+    """
     # Handle negative time (future)
-    if diff.total_seconds() < 0:
+    if elapsed_minutes <= 0:
         return "just now"
     
     # Convert to appropriate unit
-    seconds = diff.total_seconds()
-    
-    if seconds < 60:
-        return "just now"
-    elif seconds < 120:
-        return "1 minute ago"
-    elif seconds < 3600:  # Less than 1 hour
-        minutes = int(seconds / 60)
-        return f"{minutes} minutes ago"
-    elif seconds < 7200:  # Less than 2 hours
-        return "1 hour ago"
-    elif seconds < 86400:  # Less than 1 day
-        hours = int(seconds / 3600)
-        return f"{hours} hours ago"
-    elif seconds < 172800:  # Less than 2 days
-        return "yesterday"
-    elif seconds < 604800:  # Less than 1 week
-        days = int(seconds / 86400)
-        return f"{days} days ago"
-    elif seconds < 1209600:  # Less than 2 weeks
-        return "1 week ago"
-    elif seconds < 2592000:  # Less than 30 days
-        weeks = int(seconds / 604800)
-        return f"{weeks} weeks ago"
-    elif seconds < 5184000:  # Less than 60 days
-        return "1 month ago"
-    elif seconds < 31536000:  # Less than 1 year
-        months = int(seconds / 2592000)
-        return f"{months} months ago"
-    elif seconds < 63072000:  # Less than 2 years
-        return "1 year ago"
-    else:
-        years = int(seconds / 31536000)
-        return f"{years} years ago"
-
-
+    seconds = elapsed_minutes * 60
+    return _BUCKETS[bisect_right(_THRESHOLDS, seconds)][1](seconds)